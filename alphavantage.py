@@ -4,11 +4,14 @@ import sys, os
 import pandas as pd
 import argparse
 import datetime
-import requests
+
+# Local modules
+import grindweb
+import grindhist
 
 DirDefault = '/home/andrei/src/market-data/stocks/alpha-vantage'
 
-def download_hist_alpha_vantage(ticker, ISIN=None, dirname=DirDefault, force=False, debug=False):
+def download_hist_alpha_vantage(ticker, ISIN=None, dirname=DirDefault, force=False, debug=False, incremental=False):
     # Today's date
     date = datetime.date.today()
     date_str = date.strftime("%Y%m%d")
@@ -33,22 +36,43 @@ def download_hist_alpha_vantage(ticker, ISIN=None, dirname=DirDefault, force=Fal
         return False
     
     url = 'https://www.alphavantage.co/query?function=TIME_SERIES_DAILY_ADJUSTED&symbol={}&outputsize=full&apikey={}&datatype=csv'.format(ticker, alpha_vantage_api_key)
+
+    # Download the bars since the latest saved history, and merge them. Alpha
+    # Vantage has no start date: the compact output has the latest 100 bars,
+    # which must reach back to the saved history
+    old_df = grindhist.load_latest_history(dirname, ticker, before=date_str) if incremental else None
+    if old_df is not None:
+        new_url = url.replace('outputsize=full', 'outputsize=compact')
+        new_fname = '{}.part'.format(fname)
+        if debug:
+            print('Get {}'.format(new_url))
+        try:
+            status = grindweb.download_file(new_url, new_fname, timeout=1)
+            if status == 200 and grindhist.update_history(fname, old_df, new_fname):
+                if debug:
+                    print('Updated {}'.format(fname))
+                return True
+        except:
+            pass
+        finally:
+            if os.path.exists(new_fname):
+                os.unlink(new_fname)
+        if debug:
+            print('{}: cannot update the history, downloading all of it'.format(ticker))
+
     if debug:
         print('Get {}'.format(url))
     try:
-        r = requests.get(url, timeout=1)
+        status = grindweb.download_file(url, fname, timeout=1)
     except:
         if debug:
             print('Failed to get history for {}'.format(ticker))
         return(False)
 
-    if r.status_code != 200:
+    if status != 200:
         if debug:
-            print('HTTP status code {}'.format(r.status_code))
+            print('HTTP status code {}'.format(status))
         return False
-
-    with open(fname, "wb") as f:
-        f.write(r.content)
         
     if debug:
         print('Saved {}'.format(fname))
@@ -61,6 +85,7 @@ if __name__ == "__main__":
     parser.add_argument('--dir', default=DirDefault, help='Output directory. Default: {}.'.format(DirDefault))
     parser.add_argument('-d', '--debug', action='store_true', help='Enable debug messages.')
     parser.add_argument('-f', '--force', action='store_true', help='Force a download even if the data is cached.')
+    parser.add_argument('-i', '--incremental', action='store_true', help='Download only the bars since the latest saved history.')
 
     args = parser.parse_args()
 
@@ -68,4 +93,5 @@ if __name__ == "__main__":
         download_hist_alpha_vantage(ticker,
                                     dirname=args.dir,
                                     force=args.force,
-                                    debug=args.debug)    
+                                    debug=args.debug,
+                                    incremental=args.incremental)    
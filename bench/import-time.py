@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+"""
+Import time benchmark for the command line modules.
+
+Each module is imported in a fresh interpreter, several times, and the best
+import time is reported, along with the heavy modules loaded by the import.
+The heavy modules must be loaded lazily, by the sub-commands needing them: the
+benchmark fails (exit status 1) if any is loaded at import time, or if an
+import takes longer than the budget.
+"""
+import sys, os
+import argparse
+import subprocess
+import json
+
+ModulesDefault = ['grindweb', 'morningstar', 'fidelity']
+RunsDefault = 5
+BudgetDefault = 150
+
+# Modules which must not be loaded at import time
+HeavyModules = ['pandas', 'numpy', 'bs4', 'lxml', 'requests', 'tabulate', 'unidecode', 'titlecase']
+
+RepoDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_probe = '''
+import sys, time, json
+t = time.perf_counter()
+import {module}
+t = time.perf_counter() - t
+import grindlazy
+print(json.dumps({{"seconds": t, "loaded": [m for m in {heavy!r} if grindlazy.is_loaded(m)]}}))
+'''
+
+def import_time(module, runs):
+    """
+    Measures the import time of a module.
+
+    Arguments:
+    module - the module name
+    runs - the number of runs
+
+    Return value:
+    The tuple (best import time in seconds, list of heavy modules loaded)
+    """
+    best = None
+    loaded = []
+    for _ in range(runs):
+        out = subprocess.check_output([sys.executable, '-c', _probe.format(module=module, heavy=HeavyModules)],
+                                      cwd=RepoDir)
+        result = json.loads(out.decode('utf-8').strip().splitlines()[-1])
+        if best is None or result['seconds'] < best:
+            best = result['seconds']
+        loaded = result['loaded']
+    return best, loaded
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the module import times.')
+    parser.add_argument('module', nargs='*', default=ModulesDefault, help='Modules. Default: {}.'.format(' '.join(ModulesDefault)))
+    parser.add_argument('-n', '--runs', type=int, default=RunsDefault, help='Number of runs per module. Default: {}.'.format(RunsDefault))
+    parser.add_argument('-b', '--budget', type=float, default=BudgetDefault, help='Import time budget, in milliseconds. Default: {}.'.format(BudgetDefault))
+
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.module:
+        seconds, loaded = import_time(module, args.runs)
+        status = 'ok'
+        if loaded:
+            status = 'FAIL (loaded {})'.format(', '.join(loaded))
+            failed = True
+        elif seconds * 1000 > args.budget:
+            status = 'FAIL (over budget)'
+            failed = True
+        print('{:<16} {:8.1f} ms  {}'.format(module, seconds * 1000, status))
+
+    sys.exit(1 if failed else 0)
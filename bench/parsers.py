@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+"""
+Parser benchmark, over pages saved by the grindweb record/replay mode.
+
+First record the pages of some tickers (network access needed):
+bench/parsers.py --record SPY FUSEX AAPL
+
+Then benchmark the Morningstar parsers offline, over the saved pages:
+bench/parsers.py SPY FUSEX AAPL
+
+For each field (named after the morningstar.py sub-commands), the parser runs
+over all tickers. The pages are replayed into the page cache up front, and the
+parsed tables are dropped before each run, so the time measured is the page
+parse and the DataFrame build. The best time per page, over several runs, and
+the peak memory allocated during a run (tracemalloc) are reported.
+"""
+import sys, os
+import argparse
+import time
+import tracemalloc
+
+# Keep the benchmark independent of the on-disk cache and ticker registry
+os.environ['GRIND_CACHE_DIR'] = ''
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Local modules
+import grindweb
+import morningstar
+
+FixturesDirDefault = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+RunsDefault = 5
+
+def run_field(field, tickers):
+    """
+    Runs a parser over the tickers, from the page cache.
+
+    Arguments:
+    field - the field name, e.g. "pfh"
+    tickers - the list of tickers
+
+    Return value:
+    The number of pages parsed (tickers the field applies to)
+    """
+    func = morningstar._fields[field][0]
+
+    # Drop the parsed tables, keep the pages
+    grindweb.set_table_cache_size(0)
+    grindweb.set_table_cache_size(grindweb.TableCacheSizeDefault)
+
+    pages = 0
+    for ticker in tickers:
+        try:
+            df = func(ticker)
+        except Exception:
+            continue
+        if df is not None:
+            pages += 1
+    return pages
+
+def bench_field(field, tickers, runs):
+    """
+    Benchmarks a parser.
+
+    Arguments:
+    field - the field name, e.g. "pfh"
+    tickers - the list of tickers
+    runs - the number of runs
+
+    Return value:
+    The tuple (pages, best time per page in seconds, peak memory in bytes)
+    """
+    # Warm up: replay the pages into the page cache
+    pages = run_field(field, tickers)
+    if not pages:
+        return 0, None, None
+
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        run_field(field, tickers)
+        elapsed = (time.perf_counter() - start) / pages
+        if best is None or elapsed < best:
+            best = elapsed
+
+    # Memory, in a separate run (tracemalloc slows the parsers down)
+    tracemalloc.start()
+    run_field(field, tickers)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return pages, best, peak
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the Morningstar parsers over saved pages.')
+    parser.add_argument('ticker', nargs='+', help='Tickers')
+    parser.add_argument('-r', '--record', action='store_true', help='Record the pages (network access needed), instead of benchmarking.')
+    parser.add_argument('--fixtures', default=FixturesDirDefault, help='Fixtures directory. Default: {}.'.format(FixturesDirDefault))
+    parser.add_argument('-f', '--fields', nargs='+', default=sorted(morningstar._fields.keys()), choices=sorted(morningstar._fields.keys()), metavar='FIELD', help='Fields. Default: all.')
+    parser.add_argument('-n', '--runs', type=int, default=RunsDefault, help='Number of runs. Default: {}.'.format(RunsDefault))
+
+    args = parser.parse_args()
+
+    if args.record:
+        grindweb.set_fixtures(args.fixtures, 'record')
+        morningstar.fetch(args.ticker, args.fields, errors="ignore")
+        sys.exit(0)
+
+    grindweb.set_fixtures(args.fixtures, 'replay')
+
+    # Resolve the ticker types up front, skip the tickers not recorded
+    tickers = []
+    for ticker in args.ticker:
+        try:
+            morningstar.ticker_type(ticker)
+        except Exception as e:
+            sys.stderr.write('Skipping {}: {}\n'.format(ticker, e))
+            continue
+        tickers.append(ticker)
+
+    print('{:<20} {:>6} {:>12} {:>12}'.format('field', 'pages', 'ms/page', 'peak KB'))
+    for field in args.fields:
+        pages, seconds, peak = bench_field(field, tickers, args.runs)
+        if not pages:
+            print('{:<20} {:>6} {:>12} {:>12}'.format(field, 0, '-', '-'))
+            continue
+        print('{:<20} {:>6} {:>12.2f} {:>12.0f}'.format(field, pages, seconds * 1000, peak / 1024.0))
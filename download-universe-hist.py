@@ -1,19 +1,13 @@
 #!/usr/bin/env python
 
 import sys, os
-import yfinance as yf
 import pandas as pd
-import numpy as np
 import argparse
 import datetime
 from enum import Enum
 
 # Local modules
-import yahoo
-import alphavantage as av
-import worldtradingdata as wtd
-import quandl
-import stooq
+import grindhist
 
 DirDefault = '/home/andrei/src/market-data'
 SecuritiesDefault = 'securities.csv'
@@ -36,6 +30,9 @@ if __name__ == "__main__":
     parser.add_argument('-i', '--interface', default=InterfaceDefault, type=DownloadInterface, choices=list(DownloadInterface), help='Download interface. Default: {}.'.format(InterfaceDefault))
     parser.add_argument('-d', '--debug', action='store_true', help='Enable debug messages.')
     parser.add_argument('-f', '--force', action='store_true', help='Force a download even if the data is cached.')
+    parser.add_argument('--incremental', action='store_true', help='Download only the bars since the latest saved history.')
+    parser.add_argument('-w', '--workers', type=int, help='Number of concurrent downloads. Default: depends on the interface.')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Do not show the progress.')
 
     args = parser.parse_args()
 
@@ -48,47 +45,16 @@ if __name__ == "__main__":
         print('Loaded {}'.format(fname))
     #print(securities_df)
 
-    ticker_fail = []
-    ticker_success = []
-    
-    for index, row in securities_df.iterrows():
-        if args.debug:
-            print('Downloading {} from {}'.format(row['Ticker'], args.interface))                
-        if str(args.interface) == 'yahoo':    
-            ret = yahoo.download_hist_yahoo(row['Ticker'], ISIN=row['ISIN'], force=args.force, debug=args.debug)
-            if ret:
-                ticker_success.append(row['Ticker'])
-            else:
-                ticker_fail.append(row['Ticker'])
+    securities = list(zip(securities_df['Ticker'], securities_df['ISIN']))
 
-        if str(args.interface) == 'alpha_vantage':
-            ret = av.download_hist_alpha_vantage(row['Ticker'], ISIN=row['ISIN'], force=args.force, debug=args.debug)
-            if ret:
-                ticker_success.append(row['Ticker'])
-            else:
-                ticker_fail.append(row['Ticker'])
+    ticker_success, ticker_fail = grindhist.download_universe(securities, 
+                                                              str(args.interface),
+                                                              max_workers=args.workers,
+                                                              progress=None if args.quiet else sys.stderr,
+                                                              force=args.force,
+                                                              debug=args.debug,
+                                                              incremental=args.incremental)
 
-        if str(args.interface) == 'world_trading_data':
-            ret = wtd.download_hist_world_trading_data(row['Ticker'], ISIN=row['ISIN'], force=args.force, debug=args.debug)
-            if ret:
-                ticker_success.append(row['Ticker'])
-            else:
-                ticker_fail.append(row['Ticker'])
-
-        if str(args.interface) == 'quandl':
-            ret = quandl.download_hist_quandl(row['Ticker'], ISIN=row['ISIN'], force=args.force, debug=args.debug)
-            if ret:
-                ticker_success.append(row['Ticker'])
-            else:
-                ticker_fail.append(row['Ticker'])
-
-        if str(args.interface) == 'stooq':
-            ret = stooq.download_hist_stooq(row['Ticker'], ISIN=row['ISIN'], force=args.force, debug=args.debug)
-            if ret:
-                ticker_success.append(row['Ticker'])
-            else:
-                ticker_fail.append(row['Ticker'])
-                
     if args.debug:
         print('{} symbols success, {} symbols fail ({})'.format(len(ticker_success), len(ticker_fail), ticker_fail))
             
@@ -1,24 +1,157 @@
 #!/usr/bin/env python
 
 import sys
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
-from tabulate import tabulate
 import argparse
-import unidecode
 import json
-import titlecase
 
 # Local modules
+import grindlazy
 import grindweb
 
+# Loaded on first use
+titlecase = grindlazy.lazy_import('titlecase')
+
 """
 Module for parsing Morningstar web data.
 """
 
-_ticker_cache = dict()
-_name_cache = dict()
+# Quote records, indexed by ticker
+_quote_cache = dict()
+
+# The Fidelity quote URL, followed by a comma separated list of symbols
+_url_quote = "https://fastquote.fidelity.com/service/quote/json?productid=embeddedquotes&symbols="
+
+# Number of symbols per quote request
+BatchSizeDefault = 50
+
+def _get_quotes(url):
+    """
+    Description:
+    Get and decode a fastquote page.
+
+    Parameters:
+    url - The quote URL.
+
+    Returns:
+    Dictionary with the "STATUS" and "QUOTES" entries. "QUOTES" is indexed by
+    symbol.
+    """
+    # Get the page
+    r = grindweb.get_web_page(url)
+    
+    # Strip the '(' at beginning and the ')' at end
+    return json.loads(r[1:-1])
+
+class _QuoteRecord(object):
+    """
+    Description:
+    The quote of a security, decoded once out of the fastquote page, and 
+    shared by ticker_type and ticker_name. The slots keep the memory 
+    footprint small when resolving many securities. 
+    
+    To expose a new quote field, add its slot and JSON key to _keys.
+    """
+    __slots__ = ('ticker', 'security_type', 'issue_description', 'full_name')
+
+    # Slots, with values set to the quote JSON keys
+    _keys = {
+        'security_type': 'SECURITY_TYPE',
+        'issue_description': 'ISSUE_DESCRIPTION',
+        'full_name': 'NAME',
+    }
+
+    def __init__(self, ticker, quote):
+        """
+        Parameters:
+        ticker - The security ticker.
+        quote - The quote JSON dictionary, or None if the ticker can't be 
+                resolved.
+        """
+        self.ticker = ticker
+        for slot, key in self._keys.items():
+            setattr(self, slot, quote.get(key) if quote else None)
+
+    def type(self):
+        """
+        Description:
+        Get the security type (see ticker_type).
+        """
+        if self.security_type is None:
+            return ""
+
+        if self.security_type == "Equity":
+            if self.issue_description == "ETF":
+                return "ETF"
+            return "Stock"
+
+        if self.security_type == "MutualFund":
+            return "Fund"
+
+        return self.security_type
+
+    def name(self):
+        """
+        Description:
+        Get the security name (see ticker_name).
+        """
+        if self.full_name is None or self.security_type is None:
+            return ""
+
+        if self.security_type != "Index":
+            return titlecase.titlecase(self.full_name)
+
+        return self.full_name
+
+def _cache_quotes(tickers, data):
+    """
+    Description:
+    Fill the quote cache out of a decoded quote page.
+    """
+    for ticker in tickers:
+        quote = None
+        if data["STATUS"]["ERROR_CODE"] == "0":
+            quote = data.get("QUOTES", {}).get(ticker)
+
+        _quote_cache[ticker] = _QuoteRecord(ticker, quote)
+
+def _resolve(tickers, batch_size=BatchSizeDefault):
+    """
+    Description:
+    Look up the quotes of the tickers missing from the cache, packing up to
+    batch_size symbols in each request. The requests are issued
+    concurrently.
+
+    Parameters:
+    tickers - The list of security tickers.
+    batch_size - The number of symbols per request.
+    """
+    missing = []
+    seen = set()
+    for ticker in tickers:
+        if ticker not in seen and ticker not in _quote_cache:
+            missing.append(ticker)
+            seen.add(ticker)
+    if not missing:
+        return
+
+    # Tickers with separators are looked up alone
+    batches = [[ticker] for ticker in missing if " " in ticker or "," in ticker]
+    missing = [ticker for ticker in missing if " " not in ticker and "," not in ticker]
+    batches += [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+
+    # Fetch all pages concurrently, into the cache
+    grindweb.get_web_pages([_url_quote + ",".join(batch) for batch in batches])
+
+    for batch in batches:
+        data = _get_quotes(_url_quote + ",".join(batch))
+
+        # An unknown symbol may fail the whole request: look up one by one
+        if len(batch) > 1 and data["STATUS"]["ERROR_CODE"] != "0":
+            for ticker in batch:
+                _cache_quotes([ticker], _get_quotes(_url_quote + ticker))
+            continue
+
+        _cache_quotes(batch, data)
 
 def ticker_type(ticker):
     """
@@ -37,49 +170,27 @@ def ticker_type(ticker):
     if ticker.lower() == "cash":
         return "Cash"
 
-    if ticker in _ticker_cache:
-        return(_ticker_cache[ticker])
-    
-    # The Fidelity URL 
-    url = "https://fastquote.fidelity.com/service/quote/json?productid=embeddedquotes&symbols="
-    
-    # Get the page
-    r = grindweb.get_web_page(url + ticker)
-    #print(r[1:-1])
-    
-    # Strip the '(' at beginning and the ')' at end
-    data = json.loads(r[1:-1])
-    #print(data)
-    
-    if (data["STATUS"]["ERROR_CODE"] != "0"):
-        _ticker_cache[ticker] = ""
-        return ""
-        
-    try:
-        fstype = data["QUOTES"][ticker]["SECURITY_TYPE"]
-    except:
-        _ticker_cache[ticker] = ""
-        return ""
-        
-    if fstype == "Equity":
-        fitype = ""
-        try:
-            fitype = data["QUOTES"][ticker]["ISSUE_DESCRIPTION"]
-        except:
-            pass
-
-        if fitype == "ETF":
-            stype = "ETF"
-        else:
-            stype = "Stock"
-    elif fstype == "MutualFund":
-        stype = "Fund"
-    else:
-        stype = fstype
-        
-    _ticker_cache[ticker] = stype
-
-    return stype
+    if ticker not in _quote_cache:
+        _resolve([ticker])
+
+    return _quote_cache[ticker].type()
+
+def ticker_types(tickers, batch_size=BatchSizeDefault):
+    """
+    Description:
+    Finds the security types of many tickers, with a few batched requests.
+
+    Parameters:
+    tickers - The list of security tickers.
+    batch_size - The number of symbols per request.
+
+    Returns:
+    Dictionary indexed by ticker, with values set to the security type 
+    (see ticker_type)
+    """
+    _resolve([ticker for ticker in tickers if ticker.lower() != "cash"], batch_size)
+
+    return dict((ticker, ticker_type(ticker)) for ticker in tickers)
 
 def ticker_name(ticker):
     """
@@ -93,57 +204,53 @@ def ticker_name(ticker):
     The ticker name, "" (in case the ticker can't be resolved)
     """
 
-    if ticker in _name_cache:
-        return(_name_cache[ticker])
-
     # Should not contain spaces
     if " " in ticker:
         return None
 
-    # The Fidelity URL 
-    url = "https://fastquote.fidelity.com/service/quote/json?productid=embeddedquotes&symbols="
-    
-    # Get the page
-    r = grindweb.get_web_page(url + ticker)
-    #print(r[1:-1])
-    
-    # Strip the '(' at beginning and the ')' at end
-    data = json.loads(r[1:-1])
-    #print(data)
-    
-    if (data["STATUS"]["ERROR_CODE"] != "0"):
-        _name_cache[ticker] = ""
-        return ""
-        
-    try:
-        fname = data["QUOTES"][ticker]["NAME"]
-        fstype = data["QUOTES"][ticker]["SECURITY_TYPE"]
-    except:
-        _name_cache[ticker] = ""
-        return ""
-      
-    if fstype != "Index":
-        name = titlecase.titlecase(fname)
-    else:
-        name = fname
-        
-    if name is not None:
-        _name_cache[ticker] = name
-
-    return name
+    if ticker not in _quote_cache:
+        _resolve([ticker])
 
+    return _quote_cache[ticker].name()
+
+def ticker_names(tickers, batch_size=BatchSizeDefault):
+    """
+    Description:
+    Get the names of many securities, with a few batched requests.
+
+    Parameters:
+    tickers - The list of security tickers.
+    batch_size - The number of symbols per request.
+
+    Returns:
+    Dictionary indexed by ticker, with values set to the security name 
+    (see ticker_name)
+    """
+    _resolve([ticker for ticker in tickers if " " not in ticker], batch_size)
+
+    return dict((ticker, ticker_name(ticker)) for ticker in tickers)
 
 def _parse_ticker_type_f(args):
-    type = ticker_type(args.ticker)
+    if len(args.ticker) == 1:
+        type = ticker_type(args.ticker[0])
 
-    if type != "":
-        print(type)
+        if type != "":
+            print(type)
+        return
+
+    for ticker, type in ticker_types(args.ticker).items():
+        print("{} {}".format(ticker, type))
 
 def _parse_ticker_name_f(args):
-    type = ticker_name(args.ticker)
+    if len(args.ticker) == 1:
+        type = ticker_name(args.ticker[0])
+
+        if type != "":
+            print(type)
+        return
 
-    if type != "":
-        print(type)
+    for ticker, name in ticker_names(args.ticker).items():
+        print("{} {}".format(ticker, name))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Download Fidelity data.')
@@ -152,11 +259,11 @@ if __name__ == "__main__":
     subparsers = parser.add_subparsers(help='Sub-command help')
 
     parser_ticker_type = subparsers.add_parser('ticker-type', help='Get ticker type (cef, etf, index, fund, stock, cash)')
-    parser_ticker_type.add_argument('ticker', help='Ticker')
+    parser_ticker_type.add_argument('ticker', nargs='+', help='Ticker')
     parser_ticker_type.set_defaults(func=_parse_ticker_type_f)
 
     parser_ticker_name = subparsers.add_parser('ticker-name', help='Get name (all)')
-    parser_ticker_name.add_argument('ticker', help='Ticker')
+    parser_ticker_name.add_argument('ticker', nargs='+', help='Ticker')
     parser_ticker_name.set_defaults(func=_parse_ticker_name_f)
 
     args = parser.parse_args()
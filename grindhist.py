@@ -0,0 +1,303 @@
+"""
+Routines for downloading the price history of many securities in parallel.
+
+Each download interface (yahoo, stooq, ...) has its own concurrency, in line
+with the grindweb host limits of its site. The interface modules are imported
+on first use, so that only the chosen one is loaded.
+
+The history of a ticker is saved daily to {dirname}/{ticker}_{YYYYMMDD}.csv.
+In incremental mode, the interfaces download only the bars since the latest
+saved file (see history_start), and merge them into it (see merge_history).
+"""
+import os
+import io
+import re
+import datetime
+import importlib
+import threading
+import concurrent.futures
+
+# Local modules
+import grindlazy
+
+# Loaded on first use
+pd = grindlazy.lazy_import('pandas')
+
+# Number of days downloaded again before the latest saved bar, to catch
+# revisions
+OverlapDaysDefault = 7
+
+# Download interfaces, indexed by name, with values set to the tuple (module,
+# download function, concurrent downloads). The download functions take the
+# ticker, and the ISIN, force, debug and incremental keyword arguments, and
+# return True on success.
+_providers = {
+    'yahoo': ('yahoo', 'download_hist_yahoo', 4),
+    'alpha_vantage': ('alphavantage', 'download_hist_alpha_vantage', 1),
+    'world_trading_data': ('worldtradingdata', 'download_hist_world_trading_data', 2),
+    'quandl': ('quandl', 'download_hist_quandl', 4),
+    'stooq': ('stooq', 'download_hist_stooq', 2),
+}
+
+def get_provider(interface):
+    """
+    Gets the download function and concurrency of an interface, importing its
+    module.
+
+    Arguments:
+    interface - the interface name, e.g. "yahoo"
+
+    Return value:
+    The tuple (download function, concurrent downloads)
+    """
+    if interface not in _providers:
+        raise ValueError('Unknown download interface {}'.format(interface))
+
+    module, func, concurrency = _providers[interface]
+    return getattr(importlib.import_module(module), func), concurrency
+
+def download_universe(securities, interface, max_workers=None, progress=None, **kwargs):
+    """
+    Downloads the history of many securities in parallel.
+
+    Arguments:
+    securities - list of (ticker, ISIN) tuples
+    interface - the interface name, e.g. "yahoo"
+    max_workers - the number of concurrent downloads, default the interface
+                  concurrency
+    progress - the file to report the progress to (e.g. sys.stderr), or None.
+               Terminals get a single line updated in place, other files 
+               (e.g. cron logs) one plain line per security
+    kwargs - passed through to the download function (force, debug, ...)
+
+    Return value:
+    The tuple (list of tickers downloaded, list of tickers failed), in the
+    securities order. Downloads raising an exception are reported as failed.
+    """
+    # Import the interface module here, not from the worker threads
+    func, concurrency = get_provider(interface)
+    if max_workers is None:
+        max_workers = concurrency
+
+    total = len(securities)
+    done = [0]
+    lock = threading.Lock()
+    tty = progress is not None and hasattr(progress, 'isatty') and progress.isatty()
+
+    def download(ticker, ISIN):
+        if kwargs.get('debug'):
+            print('Downloading {} from {}'.format(ticker, interface))
+        try:
+            ret = func(ticker, ISIN=ISIN, **kwargs)
+        except Exception as e:
+            if kwargs.get('debug'):
+                print('{}: {}'.format(ticker, e))
+            ret = False
+
+        if progress is not None:
+            with lock:
+                done[0] += 1
+                line = '[{}/{}] {} {}'.format(done[0], total, ticker, 'ok' if ret else 'fail')
+                if tty:
+                    # Overwrite the line in place
+                    progress.write('\r{}\033[K'.format(line))
+                    if done[0] == total:
+                        progress.write('\n')
+                else:
+                    progress.write(line + '\n')
+                progress.flush()
+
+        return ret
+
+    workers = max(1, min(max_workers, total))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(lambda security: download(*security), securities))
+
+    ticker_success = [ticker for (ticker, ISIN), ret in zip(securities, results) if ret]
+    ticker_fail = [ticker for (ticker, ISIN), ret in zip(securities, results) if not ret]
+
+    return ticker_success, ticker_fail
+
+def latest_history(dirname, ticker, before=None):
+    """
+    Finds the latest history file of a ticker.
+
+    Arguments:
+    dirname - the history directory
+    ticker - the ticker
+    before - only consider the files dated before this date, "YYYYMMDD" (e.g.
+             today, to skip the file being written)
+
+    Return value:
+    The file name, or None if there is no history file
+    """
+    pattern = re.compile(r'^' + re.escape(ticker) + r'_(\d{8})\.csv$')
+    latest = None
+    try:
+        fnames = os.listdir(dirname)
+    except OSError:
+        return None
+
+    for fname in fnames:
+        m = pattern.match(fname)
+        if not m or (before is not None and m.group(1) >= before):
+            continue
+        if latest is None or m.group(1) > latest[0]:
+            latest = (m.group(1), fname)
+
+    return os.path.join(dirname, latest[1]) if latest else None
+
+def read_history(fname):
+    """
+    Reads a history file, keeping the values as text (so that the merged file
+    is written back unchanged).
+
+    Arguments:
+    fname - the file name, or CSV content as bytes
+
+    Return value:
+    The DataFrame, indexed by date, or None if the file is missing or empty
+    """
+    try:
+        if isinstance(fname, bytes):
+            df = pd.read_csv(io.BytesIO(fname), index_col=0, dtype=str)
+        else:
+            df = pd.read_csv(fname, index_col=0, dtype=str)
+    except (IOError, OSError, ValueError):
+        return None
+
+    if df.empty:
+        return None
+    return df
+
+def load_latest_history(dirname, ticker, before=None):
+    """
+    Reads the latest history file of a ticker.
+
+    Arguments:
+    dirname - the history directory
+    ticker - the ticker
+    before - only consider the files dated before this date, "YYYYMMDD"
+
+    Return value:
+    The DataFrame (see read_history), or None if there is no history file
+    """
+    fname = latest_history(dirname, ticker, before=before)
+    if fname is None:
+        return None
+    return read_history(fname)
+
+def _date_keys(df):
+    # Dates are "YYYY-MM-DD", possibly followed by a time
+    return df.index.astype(str).str[:10]
+
+def history_start(df, overlap_days=OverlapDaysDefault):
+    """
+    Gets the first date to download, to bring a saved history up to date.
+
+    Arguments:
+    df - the saved history (see read_history)
+    overlap_days - the number of days downloaded again before the latest
+                   saved bar, to catch revisions
+
+    Return value:
+    The date, as datetime.date, or None if the saved history is not indexed
+    by date (download the full history then)
+    """
+    try:
+        last = datetime.datetime.strptime(max(_date_keys(df)), '%Y-%m-%d').date()
+    except ValueError:
+        return None
+    return last - datetime.timedelta(days=overlap_days)
+
+def merge_history(old_df, new_df, rtol=1e-6):
+    """
+    Merges newly downloaded bars into a saved history. The new bars must
+    overlap the saved ones, and match them on the overlap (prices adjusted
+    for a new dividend or split are revised all the way back, and need a full
+    download).
+
+    Arguments:
+    old_df - the saved history (see read_history)
+    new_df - the new bars, starting before the latest saved bar
+    rtol - the relative tolerance when comparing the overlapping bars
+
+    Return value:
+    The merged DataFrame, in the saved history order, or None if the new bars
+    do not overlap the saved ones, or revise them (download the full history
+    then)
+    """
+    if new_df is None or list(new_df.columns) != list(old_df.columns):
+        return None
+
+    old_keys = _date_keys(old_df)
+    new_keys = _date_keys(new_df)
+
+    # The new bars must reach back to the latest saved bar
+    if min(new_keys) > max(old_keys):
+        return None
+
+    # Compare the overlapping bars
+    overlap = sorted(set(old_keys) & set(new_keys))
+    old_overlap = old_df[old_keys.isin(overlap)].copy()
+    new_overlap = new_df[new_keys.isin(overlap)].copy()
+    old_overlap.index = _date_keys(old_overlap)
+    new_overlap.index = _date_keys(new_overlap)
+    old_overlap = old_overlap.sort_index()
+    new_overlap = new_overlap.sort_index()
+    if old_overlap.shape != new_overlap.shape:
+        return None
+
+    # Numbers must match within rtol, and a value appearing or disappearing
+    # (blank in one of them) is a revision too. The other values (text, or 
+    # blank in both) must match exactly.
+    old_values = old_overlap.apply(pd.to_numeric, errors='coerce')
+    new_values = new_overlap.apply(pd.to_numeric, errors='coerce')
+    old_text = old_overlap.fillna('').values
+    new_text = new_overlap.fillna('').values
+    diff = (old_values - new_values).abs().values > rtol * new_values.abs().values
+    diff |= old_values.isna().values != new_values.isna().values
+    diff |= old_values.isna().values & new_values.isna().values & (old_text != new_text)
+    if diff.any():
+        return None
+
+    # Keep the saved bars before the new ones
+    start = min(new_keys)
+    merged = pd.concat([old_df[old_keys < start], new_df])
+
+    ascending = old_keys[0] <= old_keys[-1]
+    keys = _date_keys(merged)
+    order = sorted(range(len(merged)), key=lambda i: keys[i], reverse=not ascending)
+    return merged.iloc[order]
+
+def update_history(fname, old_df, new):
+    """
+    Merges newly downloaded bars into a saved history, and writes the result.
+
+    Arguments:
+    fname - the output file name
+    old_df - the saved history (see read_history)
+    new - the new bars, as a file name or CSV content as bytes
+
+    Return value:
+    True if fname was written, False if the new bars cannot be merged (see
+    merge_history)
+    """
+    merged = merge_history(old_df, read_history(new))
+    if merged is None:
+        return False
+
+    write_history(fname, merged)
+    return True
+
+def write_history(fname, df):
+    """
+    Writes a history file (atomically, see grindweb.write_file_atomic).
+
+    Arguments:
+    fname - the file name
+    df - the history
+    """
+    # grindweb pulls in requests & co, only needed here
+    import grindweb
+    grindweb.write_file_atomic(fname, df.to_csv().encode('utf-8'))
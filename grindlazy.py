@@ -0,0 +1,72 @@
+"""
+Routines for importing modules lazily.
+
+The command line tools import pandas, BeautifulSoup, requests, ... at the
+top, but most sub-commands need only a few of them. Lazily imported modules
+are loaded on first attribute access, so that the import cost is paid only
+by the sub-commands using them.
+
+A lazily imported module is a placeholder, which imports the real module on
+first attribute access, under a lock, and then takes on its attributes. Unlike
+importlib.util.LazyLoader, the first access is safe from concurrent threads.
+The real module is only registered in sys.modules once loaded.
+"""
+import sys
+import types
+import threading
+import importlib
+import importlib.util
+
+_lock = threading.RLock()
+
+class _LazyModule(types.ModuleType):
+    """
+    Placeholder for a module not loaded yet.
+    """
+    def __getattr__(self, attr):
+        # Only called for the attributes missing from the placeholder
+        module = self.__dict__.get('_lazy_module')
+        if module is None:
+            with _lock:
+                module = self.__dict__.get('_lazy_module')
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    self.__dict__.update(module.__dict__)
+                    # Set last: other threads skip the lock once it is set
+                    self.__dict__['_lazy_module'] = module
+
+        # Attributes set after the load (e.g. submodules imported later)
+        return getattr(module, attr)
+
+def lazy_import(name):
+    """
+    Imports a module lazily. The module is loaded on first attribute access.
+    Modules already imported are returned as is.
+
+    Arguments:
+    name - the module name, e.g. "pandas"
+
+    Return value:
+    The module
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+
+    if importlib.util.find_spec(name) is None:
+        raise ImportError("No module named {}".format(name), name=name)
+
+    return _LazyModule(name)
+
+def is_loaded(name):
+    """
+    Checks whether a module was imported and loaded (a lazily imported module
+    is loaded on first attribute access).
+
+    Arguments:
+    name - the module name
+
+    Return value:
+    True if the module is loaded
+    """
+    return name in sys.modules
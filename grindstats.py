@@ -0,0 +1,162 @@
+"""
+Routines for instrumenting web queries and parsing.
+
+Timings are recorded per stage and host into histograms, along with counters
+(cache hits and misses, bytes, ...). Set GRIND_STATS to a file name to dump
+the statistics as JSON when the process exits.
+"""
+import os
+import sys
+import time
+import json
+import atexit
+import threading
+
+# Histogram bucket upper bounds, in seconds
+Buckets = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 60.0)
+
+# Timings, indexed by (stage, host), with values set to _Histogram objects
+_timings = dict()
+
+# Counters, indexed by (name, host)
+_counters = dict()
+
+_lock = threading.Lock()
+
+class _Histogram(object):
+    """
+    Fixed bucket latency histogram.
+    """
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = [0] * (len(Buckets) + 1)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+        idx = 0
+        while idx < len(Buckets) and seconds > Buckets[idx]:
+            idx += 1
+        self.buckets[idx] += 1
+
+    def percentile(self, p):
+        """
+        Returns the upper bound of the bucket holding the p-th percentile.
+        """
+        rank = p / 100.0 * self.count
+        seen = 0
+        for idx, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return Buckets[idx] if idx < len(Buckets) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'buckets': dict(zip([str(b) for b in Buckets] + ['inf'], self.buckets)),
+        }
+
+def record_timing(stage, host, seconds):
+    """
+    Records the duration of a stage.
+
+    Arguments:
+    stage - the stage name, e.g. "ttfb", "body", "parse"
+    host - the host name
+    seconds - the duration
+    """
+    with _lock:
+        histogram = _timings.get((stage, host))
+        if histogram is None:
+            histogram = _Histogram()
+            _timings[(stage, host)] = histogram
+        histogram.add(seconds)
+
+def record_count(name, host, n=1):
+    """
+    Increments a counter.
+
+    Arguments:
+    name - the counter name, e.g. "cache_hit", "bytes"
+    host - the host name
+    n - the increment
+    """
+    with _lock:
+        _counters[(name, host)] = _counters.get((name, host), 0) + n
+
+class timed(object):
+    """
+    Context manager recording the duration of the enclosed block.
+
+    Example:
+    with grindstats.timed('parse', host):
+        soup = BeautifulSoup(page, 'lxml')
+    """
+    def __init__(self, stage, host):
+        self.stage = stage
+        self.host = host
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        record_timing(self.stage, self.host, time.perf_counter() - self.start)
+
+def get_stats():
+    """
+    Gets the statistics collected so far.
+
+    Return value:
+    Dictionary with two entries: "timings", indexed by stage then host, with
+    histogram summaries, and "counters", indexed by counter name then host
+    """
+    stats = {'timings': dict(), 'counters': dict()}
+    with _lock:
+        for (stage, host), histogram in _timings.items():
+            stats['timings'].setdefault(stage, dict())[host] = histogram.summary()
+        for (name, host), n in _counters.items():
+            stats['counters'].setdefault(name, dict())[host] = n
+    return stats
+
+def dump_stats(fname=None):
+    """
+    Dumps the statistics as JSON.
+
+    Arguments:
+    fname - the output file name, or None for stderr
+    """
+    text = json.dumps(get_stats(), indent=2, sort_keys=True)
+    if fname is None:
+        sys.stderr.write(text + '\n')
+        return
+
+    with open(fname, 'w') as f:
+        f.write(text + '\n')
+
+def reset_stats():
+    """
+    Clears the statistics.
+    """
+    with _lock:
+        _timings.clear()
+        _counters.clear()
+
+if os.getenv('GRIND_STATS'):
+    atexit.register(dump_stats, os.getenv('GRIND_STATS'))
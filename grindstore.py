@@ -0,0 +1,263 @@
+"""
+Append-only store of table snapshots, keyed by ticker, table name and as-of
+date.
+
+Each (table, ticker) pair has a data file, <store>/<table>/<TICKER>.csv,
+holding the snapshots in long format, one line per cell: as-of date, row
+number, column number, row label, column label, value. The snapshots are
+appended, and never rewritten. This is a row-oriented text format rather
+than a columnar one (e.g. Parquet): it needs no extra dependency, appends in
+place, and a snapshot is read back whole anyway.
+
+The index, <store>/index.csv, has one line per snapshot: ticker, table, as-of
+date, offset and length of the snapshot in the data file, digest of the
+cells, and table (index) name. A snapshot whose cells are the same as the
+latest stored snapshot of the pair is not written again. Reads seek straight
+to the snapshot, without scanning the data file.
+
+Writers take an exclusive file lock on <store>/index.lock, so that several
+processes can add snapshots to the same store. Each process reloads the index
+lines appended by the others before using the index.
+
+The store location defaults to ~/.local/share/grind/store, and can be
+overridden with GRIND_STORE_DIR.
+"""
+import os
+import io
+import csv
+import time
+import bisect
+import hashlib
+import threading
+
+# Local modules
+import grindlazy
+import grindweb
+
+# Loaded on first use
+pd = grindlazy.lazy_import('pandas')
+
+StoreDirDefault = os.path.join(os.path.expanduser('~'), '.local', 'share', 'grind', 'store')
+
+_store_dir = os.getenv('GRIND_STORE_DIR') or StoreDirDefault
+
+# The index, indexed by (ticker, table), with values set to the list of
+# snapshots (as-of date, offset, length, digest, table name), sorted by date.
+# Loaded on first use, then refreshed from _index_offset, the size of the
+# index file already loaded.
+_index = None
+_index_offset = 0
+_lock = threading.RLock()
+
+def set_store_dir(dirname):
+    """
+    Sets the store directory.
+
+    Arguments:
+    dirname - the directory
+    """
+    global _store_dir, _index, _index_offset
+    with _lock:
+        _store_dir = dirname
+        _index = None
+        _index_offset = 0
+
+def get_store_dir():
+    """
+    Gets the store directory.
+
+    Return value:
+    The store directory
+    """
+    return _store_dir
+
+def _index_fname():
+    return os.path.join(_store_dir, 'index.csv')
+
+def _lock_fname():
+    return os.path.join(_store_dir, 'index.lock')
+
+def _data_fname(ticker, table):
+    return os.path.join(_store_dir, table, ticker.upper() + '.csv')
+
+def _add_to_index(ticker, table, as_of, offset, length, digest, name):
+    snapshots = _index.setdefault((ticker.upper(), table), [])
+    entry = (as_of, offset, length, digest, name)
+
+    # Keep the list sorted by date. A later snapshot of the same date goes
+    # after the earlier ones, and wins.
+    idx = bisect.bisect_right([s[0] for s in snapshots], as_of)
+    snapshots.insert(idx, entry)
+
+def _load_index():
+    """
+    Loads the index lines not loaded yet, including the lines appended by 
+    other processes. Must be called with _lock held.
+    """
+    global _index, _index_offset
+    if _index is None:
+        _index = dict()
+        _index_offset = 0
+
+    try:
+        with open(_index_fname(), 'rb') as f:
+            f.seek(_index_offset)
+            data = f.read()
+    except (IOError, OSError):
+        return
+
+    # Leave a line being written for the next load
+    end = data.rfind(b'\n') + 1
+    if not end:
+        return
+    _index_offset += end
+
+    for record in csv.reader(io.StringIO(data[:end].decode('utf-8'), newline='')):
+        # Skip the partial lines left by interrupted writes
+        if len(record) != 7:
+            continue
+        ticker, table, as_of, offset, length, digest, name = record
+        try:
+            _add_to_index(ticker, table, as_of, int(offset), int(length), digest, name)
+        except ValueError:
+            continue
+
+def _cells(df):
+    """
+    Gets the table cells, as records: row number, column number, row label,
+    column label, value. Missing values are stored as empty strings.
+    """
+    records = []
+    for i, (row, values) in enumerate(zip(df.index, df.values)):
+        for j, (column, value) in enumerate(zip(df.columns, values)):
+            if value is None or (isinstance(value, float) and value != value):
+                value = ''
+            records.append([i, j, row, column, value])
+    return records
+
+def _to_csv(records):
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator='\n').writerows(records)
+    return buf.getvalue()
+
+def put_table(ticker, table, df, as_of=None):
+    """
+    Stores a table snapshot, unless it is the same as the latest stored
+    snapshot.
+
+    Arguments:
+    ticker - the ticker
+    table - the table name, e.g. "pfh"
+    df - the DataFrame
+    as_of - the as-of date, "YYYY-MM-DD" (default today)
+
+    Return value:
+    True if the snapshot was written, False if it was unchanged
+    """
+    if as_of is None:
+        as_of = time.strftime('%Y-%m-%d')
+
+    cells = _cells(df)
+    digest = hashlib.sha1(_to_csv(cells).encode('utf-8')).hexdigest()
+    name = '' if df.index.name is None else str(df.index.name)
+
+    # The file lock keeps the other processes from appending in between the
+    # delta detection, the data and the index lines
+    with _lock, grindweb.file_lock(_lock_fname()):
+        _load_index()
+
+        # Delta detection, against the latest snapshot up to the as-of date
+        snapshots = _index.get((ticker.upper(), table), [])
+        idx = bisect.bisect_right([s[0] for s in snapshots], as_of)
+        if idx and snapshots[idx - 1][3] == digest and snapshots[idx - 1][4] == name:
+            return False
+
+        # Prefix each cell with the date, so the data file stands on its own
+        block = _to_csv([[as_of] + cell for cell in cells]).encode('utf-8')
+
+        fname = _data_fname(ticker, table)
+        if not os.path.isdir(os.path.dirname(fname)):
+            os.makedirs(os.path.dirname(fname))
+
+        # Append the data first, then the index line: a snapshot missing from
+        # the index is never read
+        with open(fname, 'ab') as f:
+            f.write(block)
+            f.flush()
+            offset = f.tell() - len(block)
+
+        with io.open(_index_fname(), 'a', newline='', encoding='utf-8') as f:
+            f.write(_to_csv([[ticker.upper(), table, as_of, offset, len(block), digest, name]]))
+
+        # Load the line just written
+        _load_index()
+
+    return True
+
+def get_table(ticker, table, as_of=None):
+    """
+    Gets a table as of a date, i.e. the latest snapshot stored on or before
+    the date. The values are strings, as stored.
+
+    Arguments:
+    ticker - the ticker
+    table - the table name, e.g. "pfh"
+    as_of - the as-of date, "YYYY-MM-DD" (default the latest snapshot)
+
+    Return value:
+    The DataFrame, or None if there is no snapshot on or before the date
+    """
+    with _lock:
+        _load_index()
+        snapshots = _index.get((ticker.upper(), table), [])
+        if as_of is None:
+            idx = len(snapshots)
+        else:
+            idx = bisect.bisect_right([s[0] for s in snapshots], as_of)
+        if not idx:
+            return None
+        _, offset, length, _, name = snapshots[idx - 1]
+
+    with open(_data_fname(ticker, table), 'rb') as f:
+        f.seek(offset)
+        block = f.read(length).decode('utf-8')
+
+    rows = dict()
+    columns = dict()
+    cells = dict()
+    for record in csv.reader(io.StringIO(block, newline='')):
+        _, i, j, row, column, value = record
+        i = int(i)
+        j = int(j)
+        rows[i] = row
+        columns[j] = column
+        cells[(i, j)] = value
+
+    values = [[cells.get((i, j), '') for j in range(len(columns))] for i in range(len(rows))]
+    df = pd.DataFrame(values,
+                      index=[rows[i] for i in range(len(rows))],
+                      columns=[columns[j] for j in range(len(columns))],
+                      dtype=object)
+    df.index.name = name
+
+    return df
+
+def table_dates(ticker, table):
+    """
+    Gets the dates of the stored snapshots of a table.
+
+    Arguments:
+    ticker - the ticker
+    table - the table name, e.g. "pfh"
+
+    Return value:
+    The sorted list of as-of dates, "YYYY-MM-DD"
+    """
+    with _lock:
+        _load_index()
+        dates = [s[0] for s in _index.get((ticker.upper(), table), [])]
+
+    return sorted(set(dates))
+
+if __name__ == "__main__":
+    pass
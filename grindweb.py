@@ -1,16 +1,865 @@
 """
 Routines for caching web queries
 """
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
+import os
+import re
+import time
+import datetime
+import collections
+import contextlib
+import json
+import hashlib
+import tempfile
+import threading
+import concurrent.futures
 import six
+from six.moves.urllib.parse import urlparse
 
-_web_cache = dict()
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, file locks are not taken there
+    fcntl = None
+
+# Local modules
+import grindstats
+import grindlazy
+
+# Loaded on first use
+requests = grindlazy.lazy_import('requests')
+bs4 = grindlazy.lazy_import('bs4')
+pd = grindlazy.lazy_import('pandas')
+unidecode = grindlazy.lazy_import('unidecode')
+
+CacheDirDefault = os.path.join(os.path.expanduser('~'), '.cache', 'grind')
+CacheSizeDefault = 256 * 1024 * 1024
+CacheTTLDefault = 24 * 3600
+PoolConnectionsDefault = 16
+PoolMaxsizeDefault = 8
+TableCacheSizeDefault = 32
+WebCacheSizeDefault = 256
+MaxWorkersDefault = 8
+PerHostLimitDefault = 4
+ChunkSizeDefault = 64 * 1024
+CacheHeaderAlign = 64
+
+# Default host limits: requests per second, burst size, concurrent requests
+HostLimitDefault = (10.0, 10, 8)
+
+# Result of a batch fetch. content is None when the fetch failed, and error
+# holds the exception
+PageResult = collections.namedtuple('PageResult', ['url', 'content', 'error'])
+
+# In-process cache, indexed by URL, with values set to the tuple 
+# (fetch time, content, HTTP status code, validators). Only successful (2xx)
+# responses are kept. The cache is bounded to the _web_cache_size most 
+# recently used URLs, older pages are reloaded from the disk cache.
+_web_cache = collections.OrderedDict()
+_web_cache_size = WebCacheSizeDefault
+_web_cache_lock = threading.Lock()
+
+# On-disk cache location and size budget (bytes). The directory can be
+# overridden with GRIND_CACHE_DIR; an empty value disables the disk cache.
+_cache_dir = os.getenv('GRIND_CACHE_DIR', CacheDirDefault) or None
+_cache_size = int(os.getenv('GRIND_CACHE_SIZE', CacheSizeDefault))
+
+# Bytes currently used by the disk cache (None until the directory is scanned)
+_cache_used = None
+_cache_lock = threading.RLock()
+
+# Parsed tables, indexed by URL, with values set to the list [content, tables,
+# normalized tables]. Each table is stored as a list of rows of cell texts, the
+# normalized tables (see normalize_text) are built on first use. The cache is 
+# bounded to the _table_cache_size most recently used URLs.
+_table_cache = collections.OrderedDict()
+_table_cache_size = TableCacheSizeDefault
+_table_cache_lock = threading.Lock()
+
+# Translation of the non-ASCII characters found in Morningstar pages to their
+# ASCII equivalent (same as unidecode)
+_text_translation = {
+    0x00a0: u' ',      # No-break space
+    0x00ad: u'',       # Soft hyphen
+    0x00a9: u'(c)',
+    0x00ae: u'(r)',
+    0x00b7: u'*',      # Middle dot
+    0x2009: u' ',      # Thin space
+    0x2013: u'-',      # En dash
+    0x2014: u'--',     # Em dash
+    0x2018: u"'",
+    0x2019: u"'",
+    0x201c: u'"',
+    0x201d: u'"',
+    0x2022: u'*',      # Bullet
+    0x2026: u'...',
+    0x2122: u'(tm)',
+    0x2212: u'-',      # Minus sign
+}
+
+# Time to live (seconds) per URL pattern. The first matching pattern wins, 
+# URLs not matching any pattern use CacheTTLDefault.
+_cache_ttl = [
+    (re.compile(r'quotes\.morningstar\.com/stockq/'), 7 * 24 * 3600),
+    (re.compile(r'quotes\.morningstar\.com/'), 15 * 60),
+    (re.compile(r'etfs\.morningstar\.com/quote-banner'), 15 * 60),
+    (re.compile(r'cef\.morningstar\.com/cefq/'), 15 * 60),
+    (re.compile(r'fastquote\.fidelity\.com/'), 15 * 60),
+]
+
+# Per-host limits, indexed by domain, with values set to the tuple 
+# (requests per second, burst size, concurrent requests). A host matches a
+# domain if it is the domain or one of its subdomains; the longest domain wins.
+# Hosts not matching any domain use HostLimitDefault.
+_host_limits = {
+    'morningstar.com': (2.0, 4, 4),
+    'fidelity.com': (5.0, 10, 4),
+    'stooq.com': (1.0, 2, 2),
+    'quandl.com': (5.0, 5, 4),
+    'alphavantage.co': (5.0 / 60, 1, 1),
+    'worldtradingdata.com': (1.0, 2, 2),
+}
+
+# Host governors, indexed by domain (or host, for unlisted hosts)
+_host_governors = dict()
+_host_governors_lock = threading.Lock()
+
+class _HostGovernor(object):
+    """
+    Token bucket rate limiter, combined with a concurrency semaphore.
+    """
+    def __init__(self, rate, burst, concurrency):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+
+    def acquire(self):
+        self.semaphore.acquire()
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def release(self):
+        self.semaphore.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+def configure_host(domain, rate=None, burst=None, concurrency=None):
+    """
+    Configures the request limits of a domain and its subdomains.
+
+    Arguments:
+    domain - the domain, e.g. "morningstar.com"
+    rate - the number of requests per second
+    burst - the number of requests that can be issued back to back
+    concurrency - the number of concurrent requests
+    """
+    limits = _host_limits.get(domain, HostLimitDefault)
+    _host_limits[domain] = (rate if rate is not None else limits[0],
+                            burst if burst is not None else limits[1],
+                            concurrency if concurrency is not None else limits[2])
+    with _host_governors_lock:
+        _host_governors.pop(domain, None)
+
+def host_governor(url):
+    """
+    Gets the governor that limits the requests issued to the URL host.
+
+    Arguments:
+    url - the URL
+
+    Return value:
+    The governor, to be used as a context manager around the request
+    """
+    host = urlparse(url).hostname or ''
+
+    key = host
+    for domain in _host_limits:
+        if host == domain or host.endswith('.' + domain):
+            if key == host or len(domain) > len(key):
+                key = domain
+
+    with _host_governors_lock:
+        governor = _host_governors.get(key)
+        if governor is None:
+            governor = _HostGovernor(*_host_limits.get(key, HostLimitDefault))
+            _host_governors[key] = governor
+        return governor
+
+# In-flight calls, indexed by key, with values set to _Flight objects
+_inflight = dict()
+_inflight_lock = threading.Lock()
+
+class _Flight(object):
+    """
+    A call in progress, and its outcome.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+def single_flight(key, func, *args, **kwargs):
+    """
+    Calls a function, coalescing concurrent calls with the same key. The first
+    caller runs the function, while the other callers wait and share its 
+    result (or exception).
+
+    Arguments:
+    key - identifies identical calls, e.g. the URL
+    func - the function
+    args, kwargs - the function arguments
+
+    Return value:
+    The function result
+    """
+    with _inflight_lock:
+        flight = _inflight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _Flight()
+            _inflight[key] = flight
+
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    try:
+        flight.result = func(*args, **kwargs)
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+        flight.done.set()
+
+    return flight.result
+
+# Shared HTTP session, created on first use
+_session = None
+_session_lock = threading.Lock()
+_session_config = {
+    'pool_connections': PoolConnectionsDefault,
+    'pool_maxsize': PoolMaxsizeDefault,
+    'pool_block': False,
+    'max_retries': 0,
+    'headers': {},
+}
+
+def configure_session(pool_connections=None, pool_maxsize=None, pool_block=None, 
+                      max_retries=None, headers=None):
+    """
+    Configures the shared HTTP session. The session keeps connections alive, 
+    and pools them per host. The current session is closed, and a new one is
+    created on the next request.
+
+    Arguments:
+    pool_connections - number of per-host pools to keep
+    pool_maxsize - maximum number of connections kept alive per host
+    pool_block - if True, block when a host pool is exhausted, instead of 
+                 opening extra (non-pooled) connections
+    max_retries - number of retries on connection errors
+    headers - dictionary of headers sent with every request
+    """
+    global _session
+    options = {'pool_connections': pool_connections, 'pool_maxsize': pool_maxsize,
+               'pool_block': pool_block, 'max_retries': max_retries, 'headers': headers}
+    with _session_lock:
+        for key, value in options.items():
+            if value is not None:
+                _session_config[key] = value
+        if _session is not None:
+            _session.close()
+            _session = None
+
+def get_session():
+    """
+    Gets the shared HTTP session.
+
+    Return value:
+    The requests.Session object
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=_session_config['pool_connections'],
+                pool_maxsize=_session_config['pool_maxsize'],
+                pool_block=_session_config['pool_block'],
+                max_retries=_session_config['max_retries'])
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update(_session_config['headers'])
+            _session = session
+        return _session
+
+# Record/replay fixtures. In "record" mode, the responses are saved to the
+# fixtures directory; in "replay" mode, they are served from it, without 
+# network access. Set with set_fixtures, or with GRIND_FIXTURES_DIR and 
+# GRIND_FIXTURES_MODE (default "replay").
+_fixtures_dir = os.getenv('GRIND_FIXTURES_DIR') or None
+_fixtures_mode = os.getenv('GRIND_FIXTURES_MODE', 'replay') if _fixtures_dir else None
+
+def set_fixtures(dirname, mode='replay'):
+    """
+    Sets the record/replay mode of http_get, for offline tests and benchmarks.
+
+    Arguments:
+    dirname - the fixtures directory, or None to disable record and replay
+    mode - "record" to save the responses to the directory, "replay" to serve
+           the responses from the directory (URLs without a fixture fail with 
+           requests.ConnectionError)
+    """
+    global _fixtures_dir, _fixtures_mode
+    if mode not in ('record', 'replay'):
+        raise ValueError('Unknown fixtures mode {}'.format(mode))
+    _fixtures_dir = dirname
+    _fixtures_mode = mode if dirname else None
+
+def _fixture_key(url, kwargs):
+    """
+    Identifies a request: the URL with its query parameters, and whether 
+    redirects are followed.
+    """
+    prepared = requests.models.PreparedRequest()
+    prepared.prepare_url(url, kwargs.get('params'))
+    key = prepared.url
+    if not kwargs.get('allow_redirects', True):
+        key += ' (no redirects)'
+    return key
+
+def _fixture_path(key):
+    return os.path.join(_fixtures_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.fixture')
+
+def _fixture_record(key, r):
+    """
+    Saves a response: a JSON header line, followed by the content.
+    """
+    header = {'key': key, 'url': r.url, 'status': r.status_code, 'reason': r.reason,
+              'encoding': r.encoding, 'headers': dict(r.headers)}
+    os.makedirs(_fixtures_dir, exist_ok=True)
+    write_file_atomic(_fixture_path(key), json.dumps(header).encode('utf-8') + b'\n' + r.content)
+
+def _fixture_replay(key):
+    """
+    Builds a response out of a saved fixture.
+    """
+    try:
+        with open(_fixture_path(key), 'rb') as f:
+            header = json.loads(f.readline().decode('utf-8'))
+            content = f.read()
+    except (IOError, OSError, ValueError):
+        raise requests.ConnectionError('No fixture for {}'.format(key))
+
+    r = requests.models.Response()
+    r.status_code = header['status']
+    r.reason = header['reason']
+    r.url = header['url']
+    r.encoding = header['encoding']
+    r.headers = requests.structures.CaseInsensitiveDict(header['headers'])
+    r.elapsed = datetime.timedelta(0)
+    r._content = content
+    r._content_consumed = True
+    return r
+
+def http_get(url, **kwargs):
+    """
+    Issues an HTTP GET through the shared session, within the URL host 
+    limits (see configure_host). Responses are recorded or replayed if set 
+    (see set_fixtures).
+
+    Arguments:
+    url - the URL to retrieve
+    kwargs - passed through to requests.Session.get (params, timeout, 
+             allow_redirects, stream, ...)
+
+    Return value:
+    The requests.Response object
+    """
+    host = urlparse(url).hostname or ''
+
+    if _fixtures_mode == 'replay':
+        grindstats.record_count('replays', host)
+        return _fixture_replay(_fixture_key(url, kwargs))
+
+    start = time.perf_counter()
+
+    with host_governor(url):
+        grindstats.record_timing('throttle', host, time.perf_counter() - start)
+        return _http_get(url, **kwargs)
+
+@contextlib.contextmanager
+def stream_get(url, **kwargs):
+    """
+    Issues a streamed HTTP GET through the shared session. Unlike 
+    http_get(url, stream=True), the URL host limits are held while the body 
+    is read, until the context exits.
+
+    Arguments:
+    url - the URL to retrieve
+    kwargs - passed through to requests.Session.get (params, timeout, ...)
+
+    Return value:
+    Context manager returning the requests.Response object, closed on exit
+    """
+    host = urlparse(url).hostname or ''
+
+    if _fixtures_mode == 'replay':
+        grindstats.record_count('replays', host)
+        yield _fixture_replay(_fixture_key(url, kwargs))
+        return
+
+    start = time.perf_counter()
+
+    with host_governor(url):
+        grindstats.record_timing('throttle', host, time.perf_counter() - start)
+        r = _http_get(url, stream=True, **kwargs)
+        try:
+            yield r
+        finally:
+            r.close()
+
+def _http_get(url, **kwargs):
+    """
+    Issues an HTTP GET through the shared session, and records its statistics
+    (and the response, if set, see set_fixtures). The caller holds the URL 
+    host governor.
+    """
+    host = urlparse(url).hostname or ''
+
+    started = time.perf_counter()
+    try:
+        r = get_session().get(url, **kwargs)
+    except Exception:
+        grindstats.record_count('errors', host)
+        raise
+
+    # Time to first byte includes DNS lookup and connection set-up, which 
+    # requests does not report separately
+    elapsed = time.perf_counter() - started
+    ttfb = r.elapsed.total_seconds()
+    grindstats.record_count('requests', host)
+    grindstats.record_count('status_{}'.format(r.status_code), host)
+    grindstats.record_timing('ttfb', host, ttfb)
+    if not kwargs.get('stream'):
+        grindstats.record_timing('body', host, max(0.0, elapsed - ttfb))
+        grindstats.record_count('bytes', host, len(r.content))
+
+    if _fixtures_mode == 'record':
+        _fixture_record(_fixture_key(url, kwargs), r)
+
+    return r
+
+def download_file(url, fname, check=None, chunk_size=ChunkSizeDefault, check_whole=False, **kwargs):
+    """
+    Streams a web page to a file, without holding the whole content in memory.
+    The content is written to a temporary file next to fname, then renamed, 
+    so that fname is either left untouched or complete.
+
+    Arguments:
+    url - the URL to retrieve
+    fname - the output file name
+    check - optional function called with the first chunk of content. Returns 
+            the bytes to write in place of the first chunk, or None to abandon 
+            the download
+    chunk_size - the chunk size, in bytes
+    check_whole - if True, check is called with the whole content instead,
+                  once downloaded (for messages which may span chunks), and
+                  returns the bytes to write in place of the whole content
+    kwargs - passed through to stream_get (params, timeout, ...)
+
+    Return value:
+    The HTTP status code (the file is only written for 200), or None if the 
+    download was abandoned by check
+    """
+    host = urlparse(url).hostname or ''
+
+    # The host limits are held until the whole body is read
+    with stream_get(url, **kwargs) as r:
+        if r.status_code != 200:
+            return r.status_code
+
+        start = time.perf_counter()
+
+        chunks = r.iter_content(chunk_size=chunk_size)
+        chunk = next(chunks, b'')
+        if check is not None and not check_whole:
+            chunk = check(chunk)
+            if chunk is None:
+                return None
+
+        fd, tmp_fname = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(fname)), prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(chunk)
+                size = len(chunk)
+                for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+
+            if check is not None and check_whole:
+                with open(tmp_fname, 'rb') as f:
+                    content = f.read()
+                checked = check(content)
+                if checked is None:
+                    os.unlink(tmp_fname)
+                    return None
+                if checked is not content:
+                    with open(tmp_fname, 'wb') as f:
+                        f.write(checked)
+
+            os.chmod(tmp_fname, 0o644)
+            os.replace(tmp_fname, fname)
+        except BaseException:
+            if os.path.exists(tmp_fname):
+                os.unlink(tmp_fname)
+            raise
+
+        grindstats.record_timing('body', host, time.perf_counter() - start)
+        grindstats.record_count('bytes', host, size)
+
+        return r.status_code
+
+def write_file_atomic(fname, content):
+    """
+    Writes a file atomically: the content is written to a temporary file in 
+    the same directory, then renamed. Missing directories are created.
+
+    Arguments:
+    fname - the file name
+    content - the file content (bytes)
+    """
+    dirname = os.path.dirname(os.path.abspath(fname))
+    os.makedirs(dirname, exist_ok=True)
+
+    fd, tmp_fname = tempfile.mkstemp(dir=dirname, prefix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.chmod(tmp_fname, 0o644)
+        os.replace(tmp_fname, fname)
+    except BaseException:
+        if os.path.exists(tmp_fname):
+            os.unlink(tmp_fname)
+        raise
+
+@contextlib.contextmanager
+def file_lock(fname, shared=False):
+    """
+    Takes an advisory lock on a file, across processes (see fcntl.flock). The
+    lock file is created if missing, along with its directory. No lock is 
+    taken where fcntl is not available.
+
+    Arguments:
+    fname - the lock file name
+    shared - if True, take a shared lock, otherwise an exclusive one
+
+    Return value:
+    Context manager holding the lock
+    """
+    if fcntl is None:
+        yield
+        return
+
+    dirname = os.path.dirname(os.path.abspath(fname))
+    os.makedirs(dirname, exist_ok=True)
+
+    fd = os.open(fname, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        # Closing the file releases the lock
+        os.close(fd)
+
+def set_cache_dir(dirname):
+    """
+    Sets the on-disk cache directory.
+
+    Arguments:
+    dirname - the cache directory, or None to disable the disk cache
+    """
+    global _cache_dir, _cache_used
+    _cache_dir = dirname
+    _cache_used = None
+
+def get_cache_dir():
+    """
+    Gets the on-disk cache directory.
+
+    Return value:
+    The cache directory, or None if the disk cache is disabled
+    """
+    return _cache_dir
+
+def set_cache_size(size):
+    """
+    Sets the on-disk cache size budget. The least recently used pages are 
+    evicted once the budget is exceeded.
+
+    Arguments:
+    size - the budget, in bytes
+    """
+    global _cache_size
+    _cache_size = size
+    _cache_evict()
+
+def set_web_cache_size(size):
+    """
+    Sets the number of pages kept in memory.
+
+    Arguments:
+    size - the number of pages
+    """
+    global _web_cache_size
+    with _web_cache_lock:
+        _web_cache_size = size
+        while len(_web_cache) > _web_cache_size:
+            _web_cache.popitem(last=False)
+
+def _web_cache_get(url):
+    with _web_cache_lock:
+        entry = _web_cache.get(url)
+        if entry is not None:
+            _web_cache.move_to_end(url)
+        return entry
+
+def _web_cache_put(url, entry):
+    with _web_cache_lock:
+        _web_cache[url] = entry
+        _web_cache.move_to_end(url)
+        while len(_web_cache) > _web_cache_size:
+            _web_cache.popitem(last=False)
+
+def set_table_cache_size(size):
+    """
+    Sets the number of pages whose parsed tables are kept in memory.
+
+    Arguments:
+    size - the number of pages
+    """
+    global _table_cache_size
+    with _table_cache_lock:
+        _table_cache_size = size
+        while len(_table_cache) > _table_cache_size:
+            _table_cache.popitem(last=False)
+
+def set_cache_ttl(pattern, ttl):
+    """
+    Sets the time to live for the URLs matching a pattern. The pattern takes
+    precedence over the previously set patterns.
+
+    Arguments:
+    pattern - regular expression, matched against the URL
+    ttl - the time to live, in seconds
+    """
+    _cache_ttl.insert(0, (re.compile(pattern), ttl))
+
+def clear_cache():
+    """
+    Clears the in-process and the on-disk caches.
+    """
+    global _cache_used
+    with _web_cache_lock:
+        _web_cache.clear()
+
+    with _table_cache_lock:
+        _table_cache.clear()
+
+    with _cache_lock:
+        for fname, size, mtime in _cache_files():
+            _cache_unlink(fname)
+        _cache_used = None
+
+def _cache_ttl_for(url):
+    """
+    Returns the time to live for a URL, in seconds.
+    """
+    for pattern, ttl in _cache_ttl:
+        if pattern.search(url):
+            return ttl
+    return CacheTTLDefault
+
+def _cache_path(url):
+    """
+    Returns the on-disk cache file name for a URL. Files are named after the 
+    SHA-1 of the URL, and spread across 256 subdirectories.
+    """
+    key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    return os.path.join(_cache_dir, 'web', key[:2], key)
+
+def _cache_files():
+    """
+    Returns the list of on-disk cache files, as (file name, size, mtime) tuples.
+    """
+    files = []
+    if not _cache_dir:
+        return files
+
+    for dirpath, dirnames, fnames in os.walk(os.path.join(_cache_dir, 'web')):
+        for fname in fnames:
+            fname = os.path.join(dirpath, fname)
+            try:
+                st = os.stat(fname)
+            except OSError:
+                continue
+            files.append((fname, st.st_size, st.st_mtime))
+    return files
+
+def _cache_unlink(fname):
+    try:
+        os.unlink(fname)
+    except OSError:
+        pass
+
+def _cache_load(url):
+    """
+    Loads a page from the on-disk cache. 
+
+    Return value:
+    The header dictionary and the page contents, or None if the page is not cached
+    """
+    if not _cache_dir:
+        return None
+
+    fname = _cache_path(url)
+    try:
+        with open(fname, 'rb') as f:
+            header = json.loads(f.readline().decode('utf-8'))
+            content = f.read()
+    except (IOError, OSError, ValueError):
+        return None
+
+    # Guard against SHA-1 collisions and truncated files
+    if header.get('url') != url or header.get('size') != len(content):
+        return None
+
+    _cache_touch(url)
+
+    return header, content
+
+def _cache_touch(url):
+    """
+    Marks a page of the on-disk cache as recently used, for the eviction (see
+    _cache_evict).
+    """
+    if not _cache_dir:
+        return
+
+    try:
+        os.utime(_cache_path(url), None)
+    except OSError:
+        pass
+
+def _cache_store(url, header, content):
+    """
+    Stores a page in the on-disk cache. The file is written to a temporary 
+    file first, then renamed, so that readers never see a partial page.
+    """
+    global _cache_used
+    if not _cache_dir:
+        return
+
+    fname = _cache_path(url)
+    header = dict(header, url=url, size=len(content))
+
+    try:
+        write_file_atomic(fname, _cache_header(header) + content)
+    except (IOError, OSError):
+        return
+
+    with _cache_lock:
+        if _cache_used is not None:
+            _cache_used += os.path.getsize(fname)
+        _cache_evict()
+
+def _cache_header(header, size=None):
+    """
+    Returns the header line of an on-disk cache file. The line is padded with
+    spaces to a multiple of CacheHeaderAlign bytes, or to size bytes, so that 
+    it can be rewritten in place (see _cache_update_header).
+    """
+    line = json.dumps(header).encode('utf-8')
+    if size is None:
+        size = (len(line) // CacheHeaderAlign + 1) * CacheHeaderAlign
+    if len(line) + 1 > size:
+        return None
+    return line + b' ' * (size - len(line) - 1) + b'\n'
+
+def _cache_update_header(url, header):
+    """
+    Rewrites the header of a page in the on-disk cache, in place, keeping the
+    page contents (e.g. to refresh its fetch time after a 304 Not Modified 
+    response).
+
+    Return value:
+    True if the header was rewritten, False if the page is not cached, or the
+    new header does not fit (store the page again then)
+    """
+    if not _cache_dir:
+        return True
+
+    fname = _cache_path(url)
+    try:
+        with open(fname, 'r+b') as f:
+            old = json.loads(f.readline().decode('utf-8'))
+            line = _cache_header(dict(header, url=url, size=old.get('size')), f.tell())
+            if old.get('url') != url or line is None:
+                return False
+            f.seek(0)
+            f.write(line)
+    except (IOError, OSError, ValueError):
+        return False
+
+    return True
+
+def _cache_evict():
+    """
+    Evicts the least recently used pages until the cache fits its budget.
+    """
+    global _cache_used
+    if not _cache_dir:
+        return
+
+    with _cache_lock:
+        if _cache_used is not None and _cache_used <= _cache_size:
+            return
+
+        files = _cache_files()
+        _cache_used = sum(size for fname, size, mtime in files)
+
+        if _cache_used <= _cache_size:
+            return
+
+        for fname, size, mtime in sorted(files, key=lambda x: x[2]):
+            _cache_unlink(fname)
+            _cache_used -= size
+            if _cache_used <= _cache_size:
+                break
 
 def get_web_page(url, force=False):
     """
     Gets a web page from the web, or from the local cache, in case it is cached.
+    Pages are cached in-process and on disk, and refreshed once their time to 
+    live (see set_cache_ttl) expires.
 
     Arguments:
     url - the URL to retrieve
@@ -19,14 +868,144 @@ def get_web_page(url, force=False):
     Return value:
     The contents of the web page
     """
-    if force or (url not in _web_cache):
-        r = requests.get(url)
-        _web_cache[url] = r.content                
+    return _get_web_page_entry(url, force)[1]
+
+def _get_web_page_entry(url, force=False):
+    """
+    Gets a web page cache entry, fetching the page if needed. Stale (or 
+    forced) pages with validators are revalidated with a conditional request,
+    and a 304 Not Modified response keeps the cached content.
+
+    Return value:
+    The tuple (fetch time, content, HTTP status code, validators)
+    """
+    host = urlparse(url).hostname or ''
+
+    source = 'memory'
+    entry = _web_cache_get(url)
+    if entry is None:
+        source = 'disk'
+        cached = _cache_load(url)
+        if cached is not None:
+            header = cached[0]
+            entry = (header['time'], cached[1], 200, header.get('validators', {}))
+            _web_cache_put(url, entry)
+
+    if not force and entry is not None and time.time() - entry[0] < _cache_ttl_for(url):
+        grindstats.record_count('cache_hit_' + source, host)
+        # Pages served from memory are recently used on disk too
+        if source == 'memory':
+            _cache_touch(url)
+        return entry
+
+    grindstats.record_count('cache_miss', host)
+
+    # Concurrent fetches of the same URL share one request
+    return single_flight(('get_web_page', url), _fetch_web_page_entry, url, entry)
+
+def _fetch_web_page_entry(url, entry):
+    """
+    Fetches a web page, and updates its cache entry. 
+
+    Arguments:
+    url - the URL to retrieve
+    entry - the current cache entry, or None
+
+    Return value:
+    The new cache entry
+    """
+    # Conditional request headers
+    headers = dict()
+    if entry is not None and entry[2] == 200:
+        validators = entry[3]
+        if 'etag' in validators:
+            headers['If-None-Match'] = validators['etag']
+        if 'last_modified' in validators:
+            headers['If-Modified-Since'] = validators['last_modified']
+
+    r = http_get(url, headers=headers)
 
-    return _web_cache[url]
+    not_modified = r.status_code == 304 and bool(headers)
+    if not_modified:
+        # Not modified, keep the cached content
+        grindstats.record_count('not_modified', urlparse(url).hostname or '')
+        validators = dict(entry[3], **_response_validators(r))
+        entry = (time.time(), entry[1], 200, validators)
+    else:
+        entry = (time.time(), r.content, r.status_code, _response_validators(r))
 
+    # Only successful responses are cached. Error responses are returned to
+    # the current callers, and fetched again on the next call
+    if 200 <= entry[2] < 300:
+        _web_cache_put(url, entry)
 
-def get_web_page_table(url, table_idx=0, force=False):
+    # Only complete pages are persisted. Pages not modified keep their 
+    # contents on disk, only their header is refreshed
+    header = {'time': entry[0], 'validators': entry[3]}
+    if entry[2] == 200 and not (not_modified and _cache_update_header(url, header)):
+        _cache_store(url, header, entry[1])
+
+    return entry
+
+def _response_validators(r):
+    """
+    Returns the cache validators (ETag, Last-Modified) of a response.
+    """
+    validators = dict()
+    if r.headers.get('ETag'):
+        validators['etag'] = r.headers['ETag']
+    if r.headers.get('Last-Modified'):
+        validators['last_modified'] = r.headers['Last-Modified']
+    return validators
+
+def get_web_pages(urls, max_workers=MaxWorkersDefault, per_host_limit=PerHostLimitDefault, 
+                  force=False):
+    """
+    Gets many web pages concurrently, from the web or from the local cache.
+    Duplicate URLs are fetched once.
+
+    Arguments:
+    urls - the list of URLs to retrieve
+    max_workers - the number of worker threads
+    per_host_limit - the maximum number of concurrent fetches per host
+    force - if True, overwrite the cache
+
+    Return value:
+    List of PageResult(url, content, error) tuples, in the order of urls. 
+    HTTP error responses are reported as requests.HTTPError.
+    """
+    unique_urls = list(collections.OrderedDict.fromkeys(urls))
+
+    # One semaphore per host
+    host_limits = dict()
+    for url in unique_urls:
+        host = urlparse(url).netloc
+        if host not in host_limits:
+            host_limits[host] = threading.Semaphore(per_host_limit)
+
+    def fetch(url):
+        with host_limits[urlparse(url).netloc]:
+            try:
+                fetched, content, status, validators = _get_web_page_entry(url, force)
+            except Exception as e:
+                return PageResult(url, None, e)
+
+            if status >= 400:
+                error = requests.HTTPError('HTTP status code {} for {}'.format(status, url))
+                return PageResult(url, None, error)
+
+            return PageResult(url, content, None)
+
+    results = dict()
+    if unique_urls:
+        workers = max(1, min(max_workers, len(unique_urls)))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            for result in executor.map(fetch, unique_urls):
+                results[result.url] = result
+
+    return [results[url] for url in urls]
+
+def get_web_page_table(url, table_idx=0, force=False, normalize=False):
     """
     Gets a web page table in DataFrame format
 
@@ -34,49 +1013,207 @@ def get_web_page_table(url, table_idx=0, force=False):
     url - the URL to retrieve
     force - if True, overwrite the cache
     table_idx - the index of the table
+    normalize - if True, the cell texts are converted to ASCII (see normalize_text)
+    
+    Return value:
+    The DataFrame associated to the table
+    """
+    # Get the parsed tables
+    tables = _get_web_page_tables(url, force, normalize)
+
+    # Specific tables
+    table = tables[table_idx]
+
+    with grindstats.timed('build', urlparse(url).hostname or ''):
+        return _rows_to_dataframe(table)
+
+def get_web_page_tables(url, force=False, normalize=False):
+    """
+    Gets all the web page tables, without building the DataFrames. The page 
+    is parsed once, see get_web_page_table.
+
+    Arguments:
+    url - the URL to retrieve
+    force - if True, overwrite the cache
+    normalize - if True, the cell texts are converted to ASCII (see normalize_text)
     
+    Return value:
+    List of tables, each table a list of rows of cell texts, to be converted
+    with table_to_dataframe
+    """
+    return _get_web_page_tables(url, force, normalize)
+
+def table_to_dataframe(table):
+    """
+    Converts a table returned by get_web_page_tables to DataFrame format.
+
+    Arguments:
+    table - the table, a list of rows of cell texts
+
     Return value:
     The DataFrame associated to the table
     """
+    return _rows_to_dataframe(table)
+
+def _get_web_page_tables(url, force=False, normalize=False):
+    """
+    Gets the tables of a web page, from the parsed tables cache, or by 
+    parsing the page. The page is parsed again whenever its content changes.
+
+    Return value:
+    List of tables, each table a list of rows of cell texts
+    """
+    host = urlparse(url).hostname or ''
+
     # Get the page
     web_page = get_web_page(url, force)
 
-    # Parse the contents
-    soup = BeautifulSoup(web_page, 'lxml')
+    with _table_cache_lock:
+        entry = _table_cache.get(url)
+        if entry is not None and (entry[0] is web_page or entry[0] == web_page):
+            _table_cache.move_to_end(url)
+            grindstats.record_count('table_cache_hit', host)
+        else:
+            entry = None
 
-    # List of all tables
-    tables = soup.find_all('table')
+    if entry is None:
+        grindstats.record_count('table_cache_miss', host)
 
-    # Specific tables
-    table = tables[table_idx]
+        # Parse the contents
+        with grindstats.timed('parse', host):
+            soup = bs4.BeautifulSoup(web_page, 'lxml')
 
-    # Get the number of rows and columns
-    row_count = len(table.find_all('tr'))
-    column_count = 0
+        # List of all tables
+        with grindstats.timed('extract', host):
+            tables = [_table_rows(table) for table in soup.find_all('table')]
 
-    for row in table.find_all('tr'):
-        column_idx = len(row.find_all('th')) + len(row.find_all('td'))
-        if column_count < column_idx:
-            column_count = column_idx
-    
-    #print("row_count = %s, column_count = %s"%(row_count, column_count))
+        entry = [web_page, tables, None]
+        with _table_cache_lock:
+            _table_cache[url] = entry
+            _table_cache.move_to_end(url)
+            while len(_table_cache) > _table_cache_size:
+                _table_cache.popitem(last=False)
 
-    df = pd.DataFrame(columns = range(column_count), 
-                      index = range(row_count))
-    
-    row_idx = 0
+    if not normalize:
+        return entry[1]
+
+    if entry[2] is None:
+        with grindstats.timed('normalize', host):
+            entry[2] = [[[normalize_text(text) for text in row] for row in table] 
+                        for table in entry[1]]
+    return entry[2]
+
+def _table_rows(table):
+    """
+    Extracts the text of a table, in a single pass over its rows. Header
+    cells come first in each row, followed by the data cells.
+
+    Arguments:
+    table - the BeautifulSoup table element
+
+    Return value:
+    List of rows, each row a list of cell texts
+    """
+    rows = []
     for row in table.find_all('tr'):
-        column_idx = 0
-        columns = row.find_all('th') + row.find_all('td')
-        for column in columns:
-            column_text = column.get_text()
-    
-            #print("row_idx %d, column_idx %d, text %s" % (row_idx, column_idx, column_text))
-            df.iat[row_idx, column_idx] = column_text
-            column_idx += 1
-        row_idx += 1
+        cells = row.find_all(['th', 'td'])
+        rows.append([cell.get_text() for cell in cells if cell.name == 'th'] + 
+                    [cell.get_text() for cell in cells if cell.name == 'td'])
+    return rows
 
-    return df
+def _rows_to_dataframe(rows):
+    """
+    Builds a DataFrame out of a list of rows. Short rows are padded with NaN.
+
+    Arguments:
+    rows - list of rows, each row a list of cell texts
+
+    Return value:
+    The DataFrame, with object columns
+    """
+    column_count = max([len(row) for row in rows] or [0])
+    nan = float('nan')
+
+    data = [row + [nan] * (column_count - len(row)) for row in rows]
+
+    return pd.DataFrame(data, columns=range(column_count), dtype=object)
+
+def normalize_text(text):
+    """
+    Converts a text to ASCII. The characters Morningstar pages use are 
+    translated through a precomputed table; unidecode is only called for the
+    (rare) texts still holding non-ASCII characters.
+
+    Arguments:
+    text - the text
+
+    Return value:
+    The ASCII text
+    """
+    text = text.translate(_text_translation)
+    if not text.isascii():
+        text = unidecode.unidecode(text)
+    return text
+
+def dataframe_normalize_text(df):
+    """
+    Converts the DataFrame values and index name to ASCII (see normalize_text).
+    Values which are not strings are converted to strings.
+
+    Arguments:
+    df - the DataFrame
+
+    Returns: the new DataFrame
+    """
+    values = [[normalize_text(str(x)) for x in row] for row in df.values]
+    df1 = pd.DataFrame(values, index=df.index, columns=df.columns, dtype=object)
+    if isinstance(df.index.name, six.string_types):
+        df1.index.name = normalize_text(df.index.name)
+    return df1
+
+def soup_index(soup, attrs):
+    """
+    Indexes the page elements by tag name and attribute value, in a single
+    traversal of the document. Multi-valued attributes (e.g. "class") are
+    indexed under each of their values.
+
+    Arguments:
+    soup - the parsed page
+    attrs - the attribute names to index, e.g. ("id", "gkey", "vkey")
+
+    Return value:
+    Dictionary indexed by (tag name, attribute name, attribute value), with
+    values set to the lists of matching elements, in document order
+    """
+    index = dict()
+    for tag in soup.find_all(True):
+        for attr in attrs:
+            value = tag.get(attr)
+            if value is None:
+                continue
+            if not isinstance(value, list):
+                value = [value]
+            for v in value:
+                index.setdefault((tag.name, attr, v), []).append(tag)
+    return index
+
+def soup_index_text(index, locator):
+    """
+    Gets the stripped text of an element located in a soup_index() index.
+
+    Arguments:
+    index - the index returned by soup_index()
+    locator - (tag name, attribute name, attribute value), optionally followed
+    by the match number (default 0, the first match)
+
+    Return value:
+    The element text, or None if the element is not found
+    """
+    tags = index.get(locator[:3])
+    n = locator[3] if len(locator) > 3 else 0
+    if not tags or n >= len(tags):
+        return None
+    return tags[n].getText().strip()
 
 def dataframe_promote_1st_row_and_column_as_labels(df):
     """
@@ -105,5 +1242,111 @@ def dataframe_promote_1st_row_and_column_as_labels(df):
 
     return df
 
+# Cell values standing for missing numbers
+NumericPlaceholders = ("", "-", "--", "---", u"\u2014", u"\u2013", "N/A", "NA", "nan", "None")
+
+# Characters stripped from numbers: percent signs, thousands separators,
+# currency signs and (non-breaking) spaces
+_numeric_strip = re.compile(r"[%,$\s]")
+
+# Period labels, as (pattern, period frequency). The pattern groups are the
+# year and the period number within the year (if any).
+_period_labels = [
+    (re.compile(r"^(\d{4})$"), "Y"),
+    (re.compile(r"^(\d{4})\s*-?\s*Q([1-4])$"), "Q"),
+    (re.compile(r"^Q([1-4])\s*-?\s*(\d{4})$"), "Q"),
+    (re.compile(r"^(\d{1,2})/(\d{4})$"), "M"),
+    (re.compile(r"^(\d{4})-(\d{2})$"), "M"),
+]
+
+# Date labels, with their format
+_date_labels = [
+    (re.compile(r"^\d{1,2}/\d{1,2}/\d{4}$"), "%m/%d/%Y"),
+    (re.compile(r"^\d{4}-\d{2}-\d{2}$"), "%Y-%m-%d"),
+]
+
+def _label_period(groups, freq):
+    """
+    Builds the Period of a label, from its regular expression groups. Raises
+    ValueError if the month or quarter is out of range.
+    """
+    if len(groups) == 1:
+        return pd.Period(year=int(groups[0]), freq=freq)
+
+    # The year is the group with 4 digits
+    year, n = (groups[0], groups[1]) if len(groups[0]) == 4 else (groups[1], groups[0])
+    if freq == "Q":
+        return pd.Period(year=int(year), quarter=int(n), freq=freq)
+
+    if not 1 <= int(n) <= 12:
+        raise ValueError("Bad month {}".format(n))
+    return pd.Period(year=int(year), month=int(n), freq=freq)
+
+def dataframe_to_numeric(df):
+    """
+    Converts the DataFrame text columns to float64, column by column. Percent
+    signs, thousands separators and currency signs are stripped, and the
+    placeholders (see NumericPlaceholders) become NaN. Columns holding text
+    which is not a number (e.g. category names) are left unchanged.
+
+    Arguments:
+    df - the DataFrame
+
+    Returns: the new DataFrame
+    """
+    columns = []
+    for idx in range(len(df.columns)):
+        col = df.iloc[:, idx]
+        text = col.astype(str).str.replace(_numeric_strip, "", regex=True)
+        missing = text.isin(NumericPlaceholders) | col.isna()
+        values = pd.to_numeric(text.mask(missing), errors="coerce")
+        if (values.isna() & ~missing).any():
+            columns.append(col)
+        else:
+            columns.append(values.astype("float64"))
+
+    df1 = pd.DataFrame(dict((idx, col.values) for idx, col in enumerate(columns)), 
+                       index=df.index, columns=range(len(columns)))
+    df1.index = labels_to_periods(df.index)
+    df1.columns = labels_to_periods(df.columns)
+    return df1
+
+def labels_to_periods(labels):
+    """
+    Converts row or column labels to a PeriodIndex if they are all years 
+    (e.g. "2018"), quarters (e.g. "2018 Q1") or months (e.g. "12/2018"), or to
+    a DatetimeIndex if they are all dates (e.g. "12/31/2018" or "2018-12-31").
+    Other labels are returned unchanged.
+
+    Arguments:
+    labels - the Index
+
+    Returns: the new Index
+    """
+    text = [str(x).strip() for x in labels]
+    if not text:
+        return labels
+
+    # Labels out of range (e.g. "13/2018") or mixing formats are left 
+    # unchanged
+    for pattern, freq in _period_labels:
+        matches = [pattern.match(x) for x in text]
+        if not all(matches):
+            continue
+        try:
+            return pd.PeriodIndex([_label_period(m.groups(), freq) for m in matches], name=labels.name)
+        except (ValueError, TypeError):
+            return labels
+
+    for pattern, fmt in _date_labels:
+        if not all(pattern.match(x) for x in text):
+            continue
+        try:
+            return pd.DatetimeIndex(pd.to_datetime(text, format=fmt), name=labels.name)
+        except (ValueError, TypeError):
+            return labels
+
+    return labels
+
 if __name__ == "__main__":
     pass
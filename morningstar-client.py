@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+"""
+Thin client for 'morningstar.py serve'. Runs a sub-command on the server, and
+prints the result as JSON or CSV. Does not import pandas & co, so it starts
+quickly.
+
+Example:
+morningstar-client.py pfh SPY --numeric --format csv
+"""
+import sys
+import argparse
+from urllib.parse import urlencode
+from urllib.request import urlopen
+from urllib.error import HTTPError, URLError
+
+HostDefault = '127.0.0.1'
+PortDefault = 8765
+FormatDefault = 'json'
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Query the Morningstar server (morningstar.py serve).')
+    parser.add_argument('command', help='Sub-command, as in morningstar.py (pfh, ttl, qtr, ticker-type, fetch, ...)')
+    parser.add_argument('ticker', nargs='+', help='Ticker')
+    parser.add_argument('-y', '--years', type=int, help='Number of years (qtr sub-commands)')
+    parser.add_argument('-f', '--frequency', help='Frequency, m=monthly, q=quarterly (qtr sub-commands)')
+    parser.add_argument('-n', '--numeric', action='store_true', help='Convert the values to numbers')
+    parser.add_argument('--fields', nargs='+', help='Fields (fetch sub-command)')
+    parser.add_argument('--field', help='Field (stored sub-command)')
+    parser.add_argument('-d', '--as-of', help='As-of date, YYYY-MM-DD (stored sub-command)')
+    parser.add_argument('--format', default=FormatDefault, choices=['json', 'csv'], help='Output format (default {})'.format(FormatDefault))
+    parser.add_argument('--host', default=HostDefault, help='Server address (default {})'.format(HostDefault))
+    parser.add_argument('-p', '--port', type=int, default=PortDefault, help='Server port (default {})'.format(PortDefault))
+
+    args = parser.parse_args()
+
+    params = [('ticker', ','.join(args.ticker)), ('format', args.format)]
+    if args.years is not None:
+        params.append(('years', args.years))
+    if args.frequency is not None:
+        params.append(('frequency', args.frequency))
+    if args.numeric:
+        params.append(('numeric', 1))
+    if args.fields:
+        params.append(('fields', ','.join(args.fields)))
+    if args.field:
+        params.append(('field', args.field))
+    if args.as_of:
+        params.append(('as_of', args.as_of))
+
+    url = 'http://{}:{}/{}?{}'.format(args.host, args.port, args.command, urlencode(params))
+
+    try:
+        r = urlopen(url)
+        sys.stdout.write(r.read().decode('utf-8'))
+    except HTTPError as e:
+        sys.stderr.write('{} {}\n'.format(e.code, e.reason))
+        sys.exit(1)
+    except URLError as e:
+        sys.stderr.write('Cannot reach the server at {}:{} ({})\n'.format(args.host, args.port, e.reason))
+        sys.exit(1)
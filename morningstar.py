@@ -1,23 +1,147 @@
 #!/usr/bin/env python
 
-import sys
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
-from tabulate import tabulate
+import os
+import time
+import threading
+import concurrent.futures
 import argparse
-import unidecode
+import json
+import inspect
+from six.moves.urllib.parse import urlparse, parse_qs
 
 # Local modules
+import grindlazy
 import grindweb
+import grindstore
+
+# Loaded on first use, by the sub-commands needing them
+bs4 = grindlazy.lazy_import('bs4')
+pd = grindlazy.lazy_import('pandas')
+tabulate = grindlazy.lazy_import('tabulate')
+http_server = grindlazy.lazy_import('http.server')
 
 """
 Module for parsing Morningstar web data.
 """
 
+# Morningstar URLs, completed with the ticker
+_url_fund_summary = "http://portfolios.morningstar.com/fund/summary?t="
+_url_stock_name = "http://performance.morningstar.com/stock/performance-return.action?t="
+_url_etf_pfh = "http://performance.morningstar.com/perform/Performance/cef/performance-history.action?&ops=clear&y=10&ndec=2&align=d&t="
+_url_fund_pfh = "http://performance.morningstar.com/Performance/fund/performance-history-1.action?&ops=clear&ndec=2&align=d&t="
+_url_index_pfh = "http://performance.morningstar.com/perform/Performance/index-c/performance-history-1.action?&ops=clear&y=10&ndec=2&align=d&t="
+_url_stock_pfh = "http://performance.morningstar.com/perform/Performance/stock/performance-history-1.action?&ops=clear&y=10&ndec=2&align=d&t="
+_url_printreport = "http://quicktake.morningstar.com/fundnet/printreport.aspx?symbol="
+_url_etf_ttl = "http://performance.morningstar.com/Performance/cef/trailing-total-returns.action?ops=clear&ndec=2&align=d&t="
+_url_fund_ttl = "http://performance.morningstar.com/Performance/fund/trailing-total-returns.action?t="
+_url_index_ttl = "http://performance.morningstar.com/perform/Performance/index-c/trailing-total-returns.action?ops=clear&ndec=2&align=d&t="
+_url_cef_qtr = "http://performance.morningstar.com/perform/Performance/cef/historical-returns.action?&ops=clear&y=%s&ndec=2&freq=%s&t="
+_url_fund_qtr = "http://performance.morningstar.com/Performance/fund/historical-returns.action?&ops=clear&y=%s&freq=%s&t="
+_url_cef_quote = "http://cef.morningstar.com/cefq/cef-header?&t="
+_url_etf_quote = "http://etfs.morningstar.com/quote-banner?&t="
+_url_fund_quote = "http://quotes.morningstar.com/fund/c-header?&t="
+_url_stock_quote = "http://quotes.morningstar.com/stock/c-header?&t="
+_url_stock_profile = "http://quotes.morningstar.com/stockq/c-company-profile?&t="
+_url_stock_competitors = "http://quotes.morningstar.com/stockq/c-competitors?&t="
+
+# Time to live of the persistent ticker type registry entries (seconds)
+TickerTypeTTL = 30 * 24 * 3600
+
 _ticker_cache = dict()
 _name_cache = dict()
 
+# The persistent ticker type registry is a text file in the grindweb cache 
+# directory, with one "ticker,type,lookup time" line per lookup. The last
+# line of a ticker wins.
+_ticker_registry_lock = threading.Lock()
+
+def _ticker_registry_fname():
+    cache_dir = grindweb.get_cache_dir()
+    if not cache_dir:
+        return None
+    return os.path.join(cache_dir, 'morningstar-ticker-types.csv')
+
+def _read_ticker_registry(fname):
+    """
+    Description:
+    Reads the unexpired ticker types from the persistent registry.
+
+    Parameters:
+    fname - the registry file name
+
+    Returns:
+    The tuple (number of lines, dictionary of ticker: (type, lookup time))
+    """
+    try:
+        with open(fname) as f:
+            lines = f.read().splitlines()
+    except (IOError, OSError):
+        return 0, dict()
+
+    now = time.time()
+    registry = dict()
+    for line in lines:
+        try:
+            ticker, tt, lookup_time = line.rsplit(",", 2)
+            lookup_time = float(lookup_time)
+        except ValueError:
+            continue
+        registry[ticker] = (tt, lookup_time)
+
+    for ticker, (tt, lookup_time) in list(registry.items()):
+        if now - lookup_time >= TickerTypeTTL:
+            del registry[ticker]
+
+    return len(lines), registry
+
+def _load_ticker_registry():
+    """
+    Description:
+    Loads the unexpired ticker types from the persistent registry into 
+    _ticker_cache. The registry is compacted when it holds mostly stale lines.
+    """
+    fname = _ticker_registry_fname()
+    if not fname:
+        return
+
+    count, registry = _read_ticker_registry(fname)
+    for ticker, (tt, lookup_time) in registry.items():
+        _ticker_cache[ticker] = tt
+
+    if count <= 2 * len(registry) + 100:
+        return
+
+    # Compact under the registry file lock, which the other processes take
+    # to append, so that no line is appended to the replaced file
+    try:
+        with _ticker_registry_lock, grindweb.file_lock(fname + ".lock"):
+            count, registry = _read_ticker_registry(fname)
+            if count > 2 * len(registry) + 100:
+                content = "".join("{},{},{}\n".format(ticker, tt, lookup_time) 
+                                  for ticker, (tt, lookup_time) in registry.items())
+                grindweb.write_file_atomic(fname, content.encode("utf-8"))
+    except (IOError, OSError):
+        pass
+
+def _save_ticker_type(ticker, tt):
+    """
+    Description:
+    Appends a ticker type to the persistent registry.
+    """
+    fname = _ticker_registry_fname()
+    if not fname:
+        return
+
+    line = "{},{},{}\n".format(ticker, tt, time.time())
+    with _ticker_registry_lock:
+        try:
+            # Appends share the lock, compaction takes it exclusively
+            with grindweb.file_lock(fname + ".lock", shared=True):
+                with open(fname, "a") as f:
+                    f.write(line)
+        except (IOError, OSError):
+            pass
+
 def ticker_type(ticker):
     """
     Description:
@@ -39,34 +163,104 @@ def ticker_type(ticker):
         return "Other"
 
     if ticker not in _ticker_cache:
-        # The Morningstar URL for funds
-        url = "http://quote.morningstar.com/Quote/Quote.aspx?ticker="
-    
-        # Get the page
-        r = requests.get(url + ticker, allow_redirects = False)
-   
-        # Enable to inspect headers
-        #print(r)
-        #print(r.headers)
-
-        if r.status_code == 302:
-            if "/stock/" in r.headers['Location']:
-                _ticker_cache[ticker] = "Stock"
-            elif "/fund/" in r.headers['Location']:
-                _ticker_cache[ticker] = "Mutual Fund"
-            elif "//etfs." in r.headers['Location']:
-                _ticker_cache[ticker] = "ETF"
-                return("ETF")
-            elif "//cef." in r.headers['Location']:
-                _ticker_cache[ticker] = "CEF"
-            elif "/indexquote/" in r.headers['Location']:
-                _ticker_cache[ticker] = "Index"
+        # Concurrent lookups of the same ticker share one request
+        tt = grindweb.single_flight(("morningstar.ticker_type", ticker), _fetch_ticker_type, ticker)
+        if tt != "":
+            if ticker not in _ticker_cache:
+                _save_ticker_type(ticker, tt)
+            _ticker_cache[ticker] = tt
             
     if ticker in _ticker_cache:
         return(_ticker_cache[ticker])
     
     return ""
 
+def ticker_types(tickers, max_workers=grindweb.MaxWorkersDefault):
+    """
+    Description:
+    Finds the security types of many tickers. Tickers missing from the 
+    registry are looked up concurrently.
+
+    Parameters:
+    tickers - The list of security tickers.
+    max_workers - The number of concurrent lookups.
+
+    Returns:
+    Dictionary indexed by ticker, with values set to the security type 
+    (see ticker_type), or None if the lookup failed
+    """
+    return _ticker_types(tickers, max_workers)[0]
+
+def _ticker_types(tickers, max_workers=grindweb.MaxWorkersDefault):
+    """
+    Description:
+    Finds the security types of many tickers (see ticker_types), keeping the
+    lookup errors.
+
+    Returns:
+    The tuple (dictionary of ticker: security type or None, dictionary of 
+    ticker: exception, for the failed lookups)
+    """
+    def lookup(ticker):
+        try:
+            return ticker_type(ticker), None
+        except Exception as e:
+            return None, e
+
+    unique = list(dict.fromkeys(tickers))
+    workers = max(1, min(max_workers, len(unique)))
+    missing = [ticker for ticker in unique if ticker not in _ticker_cache]
+    if len(missing) > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            results = dict(zip(missing, executor.map(lookup, missing)))
+    else:
+        results = dict()
+
+    types = dict()
+    errors = dict()
+    for ticker in unique:
+        tt, e = results[ticker] if ticker in results else lookup(ticker)
+        types[ticker] = tt
+        if e is not None:
+            errors[ticker] = e
+
+    return types, errors
+
+def _fetch_ticker_type(ticker):
+    """
+    Description:
+    Looks up the security type on Morningstar, based on the quote page redirect.
+
+    Parameters:
+    ticker - The security ticker.
+
+    Returns:
+    The security type, or "" in case the ticker can't be resolved
+    """
+    # The Morningstar URL for funds
+    url = "http://quote.morningstar.com/Quote/Quote.aspx?ticker="
+    
+    # Get the page
+    r = grindweb.http_get(url + ticker, allow_redirects = False)
+   
+    # Enable to inspect headers
+    #print(r)
+    #print(r.headers)
+
+    if r.status_code == 302:
+        if "/stock/" in r.headers['Location']:
+            return "Stock"
+        elif "/fund/" in r.headers['Location']:
+            return "Mutual Fund"
+        elif "//etfs." in r.headers['Location']:
+            return "ETF"
+        elif "//cef." in r.headers['Location']:
+            return "CEF"
+        elif "/indexquote/" in r.headers['Location']:
+            return "Index"
+
+    return ""
+
 def ticker_name(ticker):
     """
     Description:
@@ -120,13 +314,13 @@ def fund_name(ticker):
         return None    
 
     # The Morningstar URL
-    url = "http://portfolios.morningstar.com/fund/summary?t=" + ticker
+    url = _url_fund_summary + ticker
     
     # Get the page
     web_page = grindweb.get_web_page(url)
 
     # Parse the contents
-    soup = BeautifulSoup(web_page, 'lxml')
+    soup = bs4.BeautifulSoup(web_page, 'lxml')
 
     ticker_name = soup.find("div", class_="r_title").find_next("h1").getText()
 
@@ -151,20 +345,38 @@ def stock_name(ticker):
         return None    
 
     # The Morningstar URL
-    url = "http://performance.morningstar.com/stock/performance-return.action?t=" + ticker
+    url = _url_stock_name + ticker
     
     # Get the page
     web_page = grindweb.get_web_page(url)
 
     # Parse the contents
-    soup = BeautifulSoup(web_page, 'lxml')
+    soup = bs4.BeautifulSoup(web_page, 'lxml')
 
     ticker_name = soup.find("div", class_="r_title").find_next("h1").getText()
 
     return ticker_name.encode("ascii", "ignore").decode("utf-8")
 
 
-def performance_history(ticker):
+def _as_numeric(df, numeric):
+    """
+    Description:
+    Convert a table to float64 values, if requested. Percentages, thousands
+    separators and placeholders (dashes) are handled, and year, quarter or date
+    labels become period or date indexes (see grindweb.dataframe_to_numeric).
+
+    Parameters:
+    df - The table, or None.
+    numeric - Whether to convert the table.
+
+    Returns:
+    The (converted) table.
+    """
+    if df is None or not numeric:
+        return df
+    return grindweb.dataframe_to_numeric(df)
+
+def performance_history(ticker, numeric=False):
     """
     Description:
     Get ETF, fund or stock performance history. For ETFs and stocks, this is 
@@ -172,6 +384,7 @@ def performance_history(ticker):
     
     Parameters:
     ticker - The etf, fund or stock ticker.
+    numeric - Convert the values to float64 (NaN for missing values). Default: False.
 
     Returs: 
     DataFrame with the performance history. 
@@ -182,26 +395,26 @@ def performance_history(ticker):
     if tt == "CEF":
         df = etf_performance_history(ticker)
         df.drop(df.index[[1, 2, 3, 4, 5, 6, 7]], inplace=True)
-        return df
+        return _as_numeric(df, numeric)
 
     if tt == "ETF":
         df = etf_performance_history(ticker)
         df.drop(df.index[[1, 2, 3, 4, 5, 6]], inplace=True)
-        return df
+        return _as_numeric(df, numeric)
 
     if tt == "Index":
         df = index_performance_history(ticker)
-        return df
+        return _as_numeric(df, numeric)
 
     if tt == "Mutual Fund":
         df = etf_performance_history(ticker)
         df.drop(df.index[[0, 2, 3, 4, 5, 6, 7]], inplace=True)
-        return df
+        return _as_numeric(df, numeric)
 
     if tt == "Stock":
         df = stock_performance_history(ticker)
         df.drop(df.index[[1, 2, 3, 4]], inplace=True)
-        return df
+        return _as_numeric(df, numeric)
 
     return None
 
@@ -259,7 +472,7 @@ def etf_performance_history(ticker):
         return None    
 
     # The Morningstar URL for funds
-    url = "http://performance.morningstar.com/perform/Performance/cef/performance-history.action?&ops=clear&y=10&ndec=2&align=d&t="
+    url = _url_etf_pfh
     
     df = grindweb.get_web_page_table(url + ticker)
 
@@ -288,19 +501,15 @@ def fund_performance_history(ticker):
         return None    
 
     # The Morningstar URL for funds
-    url = "http://performance.morningstar.com/Performance/fund/performance-history-1.action?&ops=clear&ndec=2&align=d&t="
+    url = _url_fund_pfh
     
-    df = grindweb.get_web_page_table(url + ticker)
+    # Get the table, with the unprintable unicode characters fixed
+    df = grindweb.get_web_page_table(url + ticker, normalize=True)
 
     # Promote 1st row and column as labels
     df = grindweb.dataframe_promote_1st_row_and_column_as_labels(df)
 
-    # For python 3 and later...
-    if (sys.version_info[0] >= 3):
-        # Fix the unprintable unicode characters
-        df.index.name = unidecode.unidecode(df.index.name)
-        df1 = df.applymap(lambda x: unidecode.unidecode(str(x)))
-        df = df1
+    df.fillna(value="", inplace=True)
 
     return df
 
@@ -323,7 +532,7 @@ def index_performance_history(ticker):
         return None    
 
     # The Morningstar URL for indexes
-    url = "http://performance.morningstar.com/perform/Performance/index-c/performance-history-1.action?&ops=clear&y=10&ndec=2&align=d&t="
+    url = _url_index_pfh
     
     df = grindweb.get_web_page_table(url + ticker)
 
@@ -353,7 +562,7 @@ def stock_performance_history(ticker):
         return None    
 
     # The Morningstar URL
-    url = "http://performance.morningstar.com/perform/Performance/stock/performance-history-1.action?&ops=clear&y=10&ndec=2&align=d&t="
+    url = _url_stock_pfh
 
     df = grindweb.get_web_page_table(url + ticker)
 
@@ -364,6 +573,116 @@ def stock_performance_history(ticker):
 
     return df
 
+class FundPrintReport(object):
+    """
+    Description:
+    The fund print report page, the slowest Morningstar page (3-10 seconds).
+    The page is fetched and parsed once, and its tables are built as 
+    DataFrames on first use. Use fund_printreport to get one.
+    """
+    # Table indexes
+    PerformanceHistoryTable = 12
+    TrailingTotalReturnsTable = 14
+    HistoricalQuarterlyReturnsTable = 16
+
+    def __init__(self, ticker):
+        self.ticker = ticker
+        self.url = _url_printreport + ticker
+
+        # The cell texts of all tables, and the DataFrames built so far
+        self._tables = grindweb.get_web_page_tables(self.url)
+        self._frames = dict()
+
+    def __len__(self):
+        return len(self._tables)
+
+    def table(self, table_idx):
+        """
+        Description:
+        Get a table, as found in the page.
+
+        Parameters:
+        table_idx - The table index.
+
+        Returns:
+        DataFrame with the table cells (a copy, that can be modified).
+        """
+        if table_idx not in self._frames:
+            self._frames[table_idx] = grindweb.table_to_dataframe(self._tables[table_idx])
+        return self._frames[table_idx].copy()
+
+    def tables(self):
+        """
+        Description:
+        Get all the tables, as found in the page.
+
+        Returns:
+        List of DataFrames.
+        """
+        return [self.table(idx) for idx in range(len(self))]
+
+    def performance_history(self):
+        """
+        Description:
+        Get the performance history, see fund_performance_history2.
+        """
+        df = self.table(self.PerformanceHistoryTable)
+
+        # Trim last three rows
+        df.drop(df.tail(3).index,inplace=True)
+
+        # Promote 1st row and column as labels
+        df = grindweb.dataframe_promote_1st_row_and_column_as_labels(df)
+
+        return df
+
+    def trailing_total_returns(self):
+        """
+        Description:
+        Get the trailing total returns, see fund_trailing_total_returns2.
+        """
+        df = self.table(self.TrailingTotalReturnsTable)
+        df.iloc[0, 1] = "Total Return %"
+        df.iloc[0, 2] = grindweb.normalize_text(df.iloc[0, 2]).replace("\r", "").replace("\n", "")
+        df.iloc[0, 3] = grindweb.normalize_text(df.iloc[0, 3]).replace("\r", "").replace("\n", "")
+        df.iloc[0, 4] = "% Rank in Cat"
+
+        # Promote 1st row and column as labels
+        df = grindweb.dataframe_promote_1st_row_and_column_as_labels(df)
+
+        return df
+
+    def historical_quarterly_returns(self):
+        """
+        Description:
+        Get the historical quarterly returns, see fund2_historical_quarterly_returns.
+        """
+        df = self.table(self.HistoricalQuarterlyReturnsTable)
+
+        # Promote 1st row and column as labels
+        df = grindweb.dataframe_promote_1st_row_and_column_as_labels(df)
+
+        return df
+
+def fund_printreport(ticker):
+    """
+    Description:
+    Get the fund print report, which holds the pfh2, ttl2 and qtr2 tables.
+    The page is fetched and parsed once for all of them.
+
+    Parameters:
+    ticker - The etf or fund ticker.
+
+    Returns:
+    FundPrintReport object, or None if the ticker is not an etf or fund.
+    """
+    # Ticker check    
+    tt = ticker_type(ticker)
+    if tt != "Mutual Fund" and tt != "ETF":
+        return None    
+
+    return FundPrintReport(ticker)
+
 def fund_performance_history2(ticker):
     """
     Description:
@@ -381,26 +700,16 @@ def fund_performance_history2(ticker):
     if tt != "Mutual Fund":
         return None    
 
-    # The Morningstar URL for funds
-    url = "http://quicktake.morningstar.com/fundnet/printreport.aspx?symbol="
-    
-    df = grindweb.get_web_page_table(url + ticker, table_idx=12)
-
-    # Trim last three rows
-    df.drop(df.tail(3).index,inplace=True)
-
-    # Promote 1st row and column as labels
-    df = grindweb.dataframe_promote_1st_row_and_column_as_labels(df)
-
-    return df
+    return fund_printreport(ticker).performance_history()
 
-def trailing_total_returns(ticker):
+def trailing_total_returns(ticker, numeric=False):
     """
     Description:
     Get trailing total returns (price for etfs, stocks, NAV for funds)
     
     Parameters:
     ticker - The ticker.
+    numeric - Convert the values to float64 (NaN for missing values). Default: False.
 
     Returs: 
     DataFrame with the trailing total returns.
@@ -411,26 +720,26 @@ def trailing_total_returns(ticker):
     if tt == "CEF":
         df = etf_trailing_total_returns(ticker)
         df.drop(df.index[[1, 2, 3, 4, 5]], inplace=True)
-        return df
+        return _as_numeric(df, numeric)
 
     if tt == "ETF":
         df = etf_trailing_total_returns(ticker)
         df.drop(df.index[[1, 2, 3, 4]], inplace=True)
-        return df
+        return _as_numeric(df, numeric)
 
     if tt == "Index":
         df = index_trailing_total_returns(ticker)
-        return df
+        return _as_numeric(df, numeric)
 
     if tt == "Mutual Fund":
         df = etf_trailing_total_returns(ticker)
         df.drop(df.index[[0, 2, 3, 4, 5]], inplace=True)
-        return df
+        return _as_numeric(df, numeric)
 
     if tt == "Stock":
         df = etf_trailing_total_returns(ticker)
         df.drop(df.index[[1, 2, 3]], inplace=True)
-        return df
+        return _as_numeric(df, numeric)
 
     return None
 
@@ -492,7 +801,7 @@ def etf_trailing_total_returns(ticker):
         return None    
 
     # The Morningstar URL for funds
-    url = "http://performance.morningstar.com/Performance/cef/trailing-total-returns.action?ops=clear&ndec=2&align=d&t="    
+    url = _url_etf_ttl
 
     df = grindweb.get_web_page_table(url + ticker)
 
@@ -521,20 +830,14 @@ def fund_trailing_total_returns(ticker):
         return None    
 
     # The Morningstar URL for funds
-    url = "http://performance.morningstar.com/Performance/fund/trailing-total-returns.action?t="    
+    url = _url_fund_ttl
 
-    df = grindweb.get_web_page_table(url + ticker)
+    # Get the table, with the unprintable unicode characters fixed
+    df = grindweb.get_web_page_table(url + ticker, normalize=True)
 
     # Promote 1st row and column as labels
     df = grindweb.dataframe_promote_1st_row_and_column_as_labels(df)
 
-    # For python 3 and later...
-    if (sys.version_info[0] >= 3):
-        # Fix the unprintable unicode characters
-        df.index.name = unidecode.unidecode(df.index.name)
-        df1 = df.applymap(lambda x: unidecode.unidecode(x))
-        df = df1
-
     return df
 
 def fund_trailing_total_returns2(ticker):
@@ -553,19 +856,7 @@ def fund_trailing_total_returns2(ticker):
     if tt != "Mutual Fund":
         return None    
 
-    # The Morningstar URL for funds
-    url = "http://quicktake.morningstar.com/fundnet/printreport.aspx?symbol="
-    
-    df = grindweb.get_web_page_table(url + ticker, table_idx=14)
-    df.iloc[0, 1] = "Total Return %"
-    df.iloc[0, 2] = unidecode.unidecode(df.iloc[0, 2]).replace("\r", "").replace("\n", "")
-    df.iloc[0, 3] = unidecode.unidecode(df.iloc[0, 3]).replace("\r", "").replace("\n", "")
-    df.iloc[0, 4] = "% Rank in Cat"
-
-    # Promote 1st row and column as labels
-    df = grindweb.dataframe_promote_1st_row_and_column_as_labels(df)
-
-    return df 
+    return fund_printreport(ticker).trailing_total_returns()
 
 def index_trailing_total_returns(ticker):
     """
@@ -585,7 +876,7 @@ def index_trailing_total_returns(ticker):
         return None    
 
     # The Morningstar URL
-    url = "http://performance.morningstar.com/perform/Performance/index-c/trailing-total-returns.action?ops=clear&ndec=2&align=d&t="    
+    url = _url_index_ttl
 
     df = grindweb.get_web_page_table(url + ticker)
 
@@ -596,7 +887,7 @@ def index_trailing_total_returns(ticker):
 
     return df
 
-def historical_quarterly_returns(ticker, years = 5, frequency = "q"):
+def historical_quarterly_returns(ticker, years = 5, frequency = "q", numeric = False):
     """
     Description:
     Get historical quarterly returns.
@@ -605,33 +896,34 @@ def historical_quarterly_returns(ticker, years = 5, frequency = "q"):
     ticker - The etf, fund or stock ticker.
     years - The number of years. Default: 5.
     frequency - "q" for quarterly, "m" for monthly. Default: "q"
+    numeric - Convert the values to float64 (NaN for missing values). Default: False.
     """
     # Ticker check    
     tt = ticker_type(ticker)
     if tt == "CEF":
         df = cef_historical_quarterly_returns(ticker, years, frequency)
         df.drop(df.columns[[1]], axis=1, inplace=True)
-        return df
+        return _as_numeric(df, numeric)
 
     if tt == "ETF":
         df = cef_historical_quarterly_returns(ticker, years, frequency)
         df.drop(df.columns[[1]], axis=1, inplace=True)
-        return df
+        return _as_numeric(df, numeric)
 
     if tt == "Index":
         df = cef_historical_quarterly_returns(ticker, years, frequency)
         df.drop(df.columns[[1]], axis=1, inplace=True)
-        return df
+        return _as_numeric(df, numeric)
         
     if tt == "Mutual Fund":
         df = cef_historical_quarterly_returns(ticker, years, frequency)
         df.drop(df.columns[[0]], axis=1, inplace=True)
-        return df
+        return _as_numeric(df, numeric)
 
     if tt == "Stock":
         df = cef_historical_quarterly_returns(ticker, years, frequency)
         df.drop(df.columns[[1]], axis=1, inplace=True)
-        return df
+        return _as_numeric(df, numeric)
 
     return None
 
@@ -691,7 +983,7 @@ def cef_historical_quarterly_returns(ticker, years = 5, frequency = "q"):
         return None
 
     # The Morningstar URL for funds
-    url = "http://performance.morningstar.com/perform/Performance/cef/historical-returns.action?&ops=clear&y=%s&ndec=2&freq=%s&t=" % (years, frequency)
+    url = _url_cef_qtr % (years, frequency)
     
     df = grindweb.get_web_page_table(url + ticker)
     df.fillna(value="", inplace=True)
@@ -721,7 +1013,7 @@ def fund_historical_quarterly_returns(ticker, years = 5, frequency = "q"):
         return None
 
     # The Morningstar URL for funds
-    url = "http://performance.morningstar.com/Performance/fund/historical-returns.action?&ops=clear&y=%s&freq=%s&t=" % (years, frequency)
+    url = _url_fund_qtr % (years, frequency)
     
     df = grindweb.get_web_page_table(url + ticker)
 
@@ -746,20 +1038,11 @@ def fund2_historical_quarterly_returns(ticker):
     Returns:
 
     """
-    # Ticker check    
-    tt = ticker_type(ticker)
-    if tt != "Mutual Fund" and tt != "ETF":
-        return None    
-
-    # The Morningstar URL for funds
-    url = "http://quicktake.morningstar.com/fundnet/printreport.aspx?symbol="
-    
-    df = grindweb.get_web_page_table(url + ticker, table_idx=16)
+    report = fund_printreport(ticker)
+    if report is None:
+        return None
 
-    # Promote 1st row and column as labels
-    df = grindweb.dataframe_promote_1st_row_and_column_as_labels(df)
-
-    return df 
+    return report.historical_quarterly_returns()
 
 def cef_quote(ticker):
     """
@@ -778,13 +1061,13 @@ def cef_quote(ticker):
         return None    
 
     # The Morningstar URL for etfs
-    url = "http://cef.morningstar.com/cefq/cef-header?&t=" + ticker
+    url = _url_cef_quote + ticker
     
     # Get the page
     web_page = grindweb.get_web_page(url)
 
     # Parse the contents
-    soup = BeautifulSoup(web_page, 'lxml')
+    soup = bs4.BeautifulSoup(web_page, 'lxml')
 
     df = pd.DataFrame(columns = range(1), 
                       index = range(16))
@@ -854,13 +1137,13 @@ def etf_quote(ticker):
         return None    
 
     # The Morningstar URL for etfs
-    url = "http://etfs.morningstar.com/quote-banner?&t=" + ticker
+    url = _url_etf_quote + ticker
     
     # Get the page
     web_page = grindweb.get_web_page(url)
 
     # Parse the contents
-    soup = BeautifulSoup(web_page, 'lxml')
+    soup = bs4.BeautifulSoup(web_page, 'lxml')
 
     df = pd.DataFrame(columns = range(1), 
                       index = range(21))
@@ -924,11 +1207,8 @@ def etf_quote(ticker):
     df.iloc[19, 0] = soup.find("span", {"id": "bid"}).getText().strip() + "/" + soup.find("span", {"id": "ask"}).getText().strip() + "/" + soup.find("span", {"id": "BidAskSpread"}).getText().strip() + "%"
     df.iloc[20, 0] = soup.find("span", {"id": "MorningstarCategory"}).getText().strip()
 
-    # For python 3 and later...
-    if (sys.version_info[0] >= 3):
-        # Fix the unprintable unicode characters
-        df1 = df.applymap(lambda x: unidecode.unidecode(x))
-        df = df1
+    # Fix the unprintable unicode characters
+    df = grindweb.dataframe_normalize_text(df)
 
     return df
 
@@ -949,13 +1229,13 @@ def fund_quote(ticker):
         return None    
 
     # The Morningstar URL for funds
-    url = "http://quotes.morningstar.com/fund/c-header?&t=" + ticker
+    url = _url_fund_quote + ticker
     
     # Get the page
     web_page = grindweb.get_web_page(url)
 
     # Parse the contents
-    soup = BeautifulSoup(web_page, 'lxml')
+    soup = bs4.BeautifulSoup(web_page, 'lxml')
 
     df = pd.DataFrame(columns = range(1), 
                       index = range(15))
@@ -1004,14 +1284,81 @@ def fund_quote(ticker):
     df.iloc[13, 0] = soup.find("span", {"vkey": "MorningstarCategory"}).getText().strip()
     df.iloc[14, 0] = soup.find("span", {"vkey": "InvestmentStyle"}).getText().strip()
 
-    # For python 3 and later...
-    if (sys.version_info[0] >= 3):
-        # Fix the unprintable unicode characters
-        df1 = df.applymap(lambda x: unidecode.unidecode(x))
-        df = df1
+    # Fix the unprintable unicode characters
+    df = grindweb.dataframe_normalize_text(df)
 
     return df
 
+# The stock quote fields, as (label, value) pairs. Labels and values are either
+# strings, element locators (tag, attribute, value), or functions of the
+# element text lookup text(locator, default), which raises ValueError for
+# missing elements without a default.
+_stock_quote_fields = [
+    (("h3", "gkey", "LastPrice"), ("div", "vkey", "LastPrice")),
+    (("h3", "gkey", "DayChange"), lambda text: text(("div", "vkey", "DayChange")).split("|")[0].strip()),
+    ("Day Change %", lambda text: text(("div", "vkey", "DayChange")).split("|")[1].strip()),
+    ("After Hours", lambda text: text(("span", "id", "after-hours"), "")),
+    ("After Hours Change", lambda text: text(("span", "id", "after-daychange-value"), "")),
+    ("After Hours Change %", lambda text: text(("span", "id", "after-daychange-per"), "")),
+    (("span", "gkey", "AsOf"), lambda text: text(("span", "id", "asOfDate")) + " " + text(("span", "id", "timezone"))),
+    (("h3", "gkey", "OpenPrice"), ("span", "vkey", "OpenPrice")),
+    (("h3", "gkey", "DayRange"), ("span", "vkey", "DayRange")),
+    (("h3", "gkey", "_52Week"), ("span", "vkey", "_52Week")),
+    (("h3", "gkey", "ProjectedYield"), ("span", "vkey", "ProjectedYield")),
+    (("h3", "gkey", "MarketCap"), ("span", "id", "MarketCap")),
+    (("h3", "gkey", "Volume"), ("span", "vkey", "Volume")),
+    (("h3", "gkey", "AverageVolume"), ("span", "vkey", "AverageVolume")),
+    (("span", "gkey", "PE"), ("span", "vkey", "PE")),
+    (("h3", "gkey", "PB"), ("span", "vkey", "PB")),
+    (("h3", "gkey", "PS"), ("span", "vkey", "PS")),
+    (("h3", "gkey", "PC"), ("span", "vkey", "PC")),
+]
+
+# The stock profile fields, as (label, locator) pairs. The values are in the
+# gr_text7 span of the located element.
+_stock_profile_fields = [
+    ("Sector", ("div", "class", "gr_colm1", 0)),
+    ("Industry", ("div", "class", "gr_colm1a", 0)),
+    ("Stock Type", ("div", "class", "gr_colm1a", 1)),
+    ("Employees", ("div", "class", "gr_colm1", 1)),
+    ("Fiscal Year Ends", ("div", "class", "gr_colm1a", 2)),
+    ("Stock Style", ("div", "class", "gr_colm1a", 3)),
+]
+
+def _resolve_fields(index, fields):
+    """
+    Description:
+    Resolve a field map against a page index.
+
+    Parameters:
+    index - The page index, see grindweb.soup_index.
+    fields - The (label, value) pairs, see _stock_quote_fields.
+
+    Returns:
+    The list of labels, and the list of values.
+    """
+    def text(locator, default=None):
+        t = grindweb.soup_index_text(index, locator)
+        if t is None:
+            if default is not None:
+                return default
+            raise ValueError("Element %s not found" % (locator,))
+        return t
+
+    def resolve(spec):
+        if isinstance(spec, str):
+            return spec
+        if isinstance(spec, tuple):
+            return text(spec)
+        return spec(text)
+
+    labels = []
+    values = []
+    for label, value in fields:
+        labels.append(resolve(label))
+        values.append(resolve(value))
+    return labels, values
+
 def stock_quote(ticker):
     """
     Description:
@@ -1029,98 +1376,35 @@ def stock_quote(ticker):
         return None    
 
     # The Morningstar URL for funds
-    url = "http://quotes.morningstar.com/stock/c-header?&t=" + ticker
+    url = _url_stock_quote + ticker
     
     # Get the page
     web_page = grindweb.get_web_page(url)
 
-    # Parse the contents
-    soup = BeautifulSoup(web_page, 'lxml')
-
-    df = pd.DataFrame(columns = range(1), 
-                      index = range(18))
-    
-    # Set the index
-    df['new_index'] = None
-    df['new_index'][0] = soup.find("h3", {"gkey": "LastPrice"}).getText().strip()
-    df['new_index'][1] = soup.find("h3", {"gkey": "DayChange"}).getText().strip()
-    df['new_index'][2] = "Day Change %"
-    df['new_index'][3] = "After Hours"
-    df['new_index'][4] = "After Hours Change"
-    df['new_index'][5] = "After Hours Change %"
-    df['new_index'][6] = soup.find("span", {"gkey": "AsOf"}).getText().strip()
-    df['new_index'][7] = soup.find("h3", {"gkey": "OpenPrice"}).getText().strip()
-    df['new_index'][8] = soup.find("h3", {"gkey": "DayRange"}).getText().strip()
-    df['new_index'][9] = soup.find("h3", {"gkey": "_52Week"}).getText().strip()
-    df['new_index'][10] = soup.find("h3", {"gkey": "ProjectedYield"}).getText().strip()
-    df['new_index'][11] = soup.find("h3", {"gkey": "MarketCap"}).getText().strip()
-    df['new_index'][12] = soup.find("h3", {"gkey": "Volume"}).getText().strip()
-    df['new_index'][13] = soup.find("h3", {"gkey": "AverageVolume"}).getText().strip()
-    df['new_index'][14] = soup.find("span", {"gkey": "PE"}).getText().strip()
-    df['new_index'][15] = soup.find("h3", {"gkey": "PB"}).getText().strip()
-    df['new_index'][16] = soup.find("h3", {"gkey": "PS"}).getText().strip()
-    df['new_index'][17] = soup.find("h3", {"gkey": "PC"}).getText().strip()
-
-    # Promote the 'new_index' column as the new index
-    df2 = df.set_index('new_index')
-    df = df2
+    # Parse the contents, and index the fields in one pass
+    soup = bs4.BeautifulSoup(web_page, 'lxml')
+    index = grindweb.soup_index(soup, ("id", "gkey", "vkey"))
 
-    # Clear the index name
-    df.index.name = ""
+    labels, values = _resolve_fields(index, _stock_quote_fields)
 
-    # Set the ticker name as column label
-    df.columns = [ticker.upper()]
+    # Fix the unprintable unicode characters
+    values = [grindweb.normalize_text(v) for v in values]
 
-    df.iloc[0, 0] = soup.find("div", {"vkey": "LastPrice"}).getText().strip()
-    df.iloc[1, 0] = soup.find("div", {"vkey": "DayChange"}).getText().split("|")[0].strip()
-    df.iloc[2, 0] = soup.find("div", {"vkey": "DayChange"}).getText().split("|")[1].strip()
-
-    afth = soup.find("span", {"id": "after-hours"})
-    if afth:
-        df.iloc[3, 0] = afth.getText().strip()
-    else:
-        df.iloc[3, 0] = ""    
-
-    afth = soup.find("span", {"id": "after-daychange-value"})
-    if afth:
-        df.iloc[4, 0] = afth.getText().strip()
-    else:
-        df.iloc[4, 0] = ""    
-
-    afth = soup.find("span", {"id": "after-daychange-per"})
-    if afth:
-        df.iloc[5, 0] = afth.getText().strip()
-    else:
-        df.iloc[5, 0] = ""    
-
-    df.iloc[6, 0] = soup.find("span", {"id": "asOfDate"}).getText().strip() + " " + soup.find("span", {"id": "timezone"}).getText().strip()
-    df.iloc[7, 0] = soup.find("span", {"vkey": "OpenPrice"}).getText().strip()
-    df.iloc[8, 0] = soup.find("span", {"vkey": "DayRange"}).getText().strip()
-    df.iloc[9, 0] = soup.find("span", {"vkey": "_52Week"}).getText().strip()
-    df.iloc[10, 0] = soup.find("span", {"vkey": "ProjectedYield"}).getText().strip()
-    df.iloc[11, 0] = soup.find("span", {"id": "MarketCap"}).getText().strip()
-    df.iloc[12, 0] = soup.find("span", {"vkey": "Volume"}).getText().strip()
-    df.iloc[13, 0] = soup.find("span", {"vkey": "AverageVolume"}).getText().strip()
-    df.iloc[14, 0] = soup.find("span", {"vkey": "PE"}).getText().strip()
-    df.iloc[15, 0] = soup.find("span", {"vkey": "PB"}).getText().strip()
-    df.iloc[16, 0] = soup.find("span", {"vkey": "PS"}).getText().strip()
-    df.iloc[17, 0] = soup.find("span", {"vkey": "PC"}).getText().strip()
-
-    # For python 3 and later...
-    if (sys.version_info[0] >= 3):
-        # Fix the unprintable unicode characters
-        df1 = df.applymap(lambda x: unidecode.unidecode(x))
-        df = df1
+    # The ticker name is the column label
+    df = pd.DataFrame({ticker.upper(): values}, 
+                      index = pd.Index(labels, name = ""),
+                      dtype = object)
 
     return df
 
-def fund_asset_allocation(ticker):
+def fund_asset_allocation(ticker, numeric=False):
     """
     Description:
     Get etf or fund asset allocation. Does not work for stocks.
     
     Parameters:
     ticker - The etf or fund ticker.
+    numeric - Convert the values to float64 (NaN for missing values). Default: False.
 
     Returs: 
     DataFrame with the performance history. 
@@ -1132,11 +1416,18 @@ def fund_asset_allocation(ticker):
         return None    
 
     # The Morningstar URL
-    url = "http://portfolios.morningstar.com/fund/summary?t="
+    url = _url_fund_summary
     
     # Get the table
-    df = grindweb.get_web_page_table(url + ticker, table_idx=1)
+    df = grindweb.get_web_page_table(url + ticker, table_idx=1, normalize=True)
+
+    return _as_numeric(_fund_asset_allocation_table(df), numeric)
 
+def _fund_asset_allocation_table(df):
+    """
+    Description:
+    Build the asset allocation table out of the raw (normalized) fund summary table.
+    """
     # Create new dataframe from rows 0, 3, 5, 7, 9, 11
     df1 = pd.DataFrame(columns = range(7), 
                        index = range(6))
@@ -1153,12 +1444,7 @@ def fund_asset_allocation(ticker):
     df1.iloc[0, 5] = "Benchmark" 
 
     df = df1
-
-    # For python 3 and later...
-    if (sys.version_info[0] >= 3):
-        # Fix the unprintable unicode characters
-        df1 = df.applymap(lambda x: unidecode.unidecode(str(x)))
-        df = df1
+    df.fillna(value="", inplace=True)
 
     # Promote 1st row and column as labels
     df1 = grindweb.dataframe_promote_1st_row_and_column_as_labels(df)
@@ -1166,13 +1452,14 @@ def fund_asset_allocation(ticker):
 
     return df
 
-def fund_market_capitalization(ticker):
+def fund_market_capitalization(ticker, numeric=False):
     """
     Description:
     Get etf or fund market capitalization. Does not work for stocks.
     
     Parameters:
     ticker - The etf or fund ticker.
+    numeric - Convert the values to float64 (NaN for missing values). Default: False.
 
     Returs: 
     DataFrame with the performance history. 
@@ -1184,11 +1471,18 @@ def fund_market_capitalization(ticker):
         return None    
 
     # The Morningstar URL
-    url = "http://portfolios.morningstar.com/fund/summary?t="
+    url = _url_fund_summary
     
     # Get the table
     df = grindweb.get_web_page_table(url + ticker, table_idx=2)
 
+    return _as_numeric(_fund_market_capitalization_table(df), numeric)
+
+def _fund_market_capitalization_table(df):
+    """
+    Description:
+    Build the market capitalization table out of the raw fund summary table.
+    """
     # Create new dataframe from rows 0, 2, 4, 6, 8, 10
     df1 = pd.DataFrame(columns = range(4), 
                        index = range(6))
@@ -1208,13 +1502,14 @@ def fund_market_capitalization(ticker):
 
     return df
 
-def fund_sector_weightings(ticker):
+def fund_sector_weightings(ticker, numeric=False):
     """
     Description:
     Get etf or fund sector weightings. Does not work for stocks.
     
     Parameters:
     ticker - The etf or fund ticker.
+    numeric - Convert the values to float64 (NaN for missing values). Default: False.
 
     Returs: 
     DataFrame with the performance history. 
@@ -1226,11 +1521,18 @@ def fund_sector_weightings(ticker):
         return None    
 
     # The Morningstar URL
-    url = "http://portfolios.morningstar.com/fund/summary?t="
+    url = _url_fund_summary
     
     # Get the table
     df = grindweb.get_web_page_table(url + ticker, table_idx=5)
 
+    return _as_numeric(_fund_sector_weightings_table(df), numeric)
+
+def _fund_sector_weightings_table(df):
+    """
+    Description:
+    Build the sector weightings table out of the raw fund summary table.
+    """
     df.fillna(value="", inplace=True)
 
     # Create new dataframe from rows 0, 2, 4, 6, 8, 10
@@ -1275,13 +1577,14 @@ def fund_sector_weightings(ticker):
 
     return df
 
-def fund_market_regions(ticker):
+def fund_market_regions(ticker, numeric=False):
     """
     Description:
     Get etf or fund market regions. Does not work for stocks.
     
     Parameters:
     ticker - The etf or fund ticker.
+    numeric - Convert the values to float64 (NaN for missing values). Default: False.
 
     Returs: 
     DataFrame with the performance history. 
@@ -1293,11 +1596,18 @@ def fund_market_regions(ticker):
         return None    
 
     # The Morningstar URL
-    url = "http://portfolios.morningstar.com/fund/summary?t="
+    url = _url_fund_summary
     
     # Get the table
-    df = grindweb.get_web_page_table(url + ticker, table_idx=6)
+    df = grindweb.get_web_page_table(url + ticker, table_idx=6, normalize=True)
+
+    return _as_numeric(_fund_market_regions_table(df), numeric)
 
+def _fund_market_regions_table(df):
+    """
+    Description:
+    Build the market regions table out of the raw (normalized) fund summary table.
+    """
     df.fillna(value="", inplace=True)
 
     # Create new dataframe from rows 0, 2, 4, 6, 8, 10
@@ -1322,12 +1632,7 @@ def fund_market_regions(ticker):
     df1.iloc[15] = df.iloc[34]
 
     df = df1
-
-    # For python 3 and later...
-    if (sys.version_info[0] >= 3):
-        # Fix the unprintable unicode characters
-        df1 = df.applymap(lambda x: unidecode.unidecode(str(x)))
-        df = df1
+    df.fillna(value="", inplace=True)
 
     # Promote 1st row and column as labels
     df1 = grindweb.dataframe_promote_1st_row_and_column_as_labels(df)
@@ -1335,6 +1640,44 @@ def fund_market_regions(ticker):
 
     return df
 
+def fund_portfolio_snapshot(ticker, numeric=False):
+    """
+    Description:
+    Get etf or fund asset allocation, market capitalization, sector weightings
+    and market regions, out of a single fetch and parse of the fund summary
+    page. Does not work for stocks.
+    
+    Parameters:
+    ticker - The etf or fund ticker.
+    numeric - Convert the values to float64 (NaN for missing values). Default: False.
+
+    Returs: 
+    Dictionary with keys "aal", "mkc", "sect", "reg", with values set to the
+    DataFrames returned by fund_asset_allocation, fund_market_capitalization,
+    fund_sector_weightings and fund_market_regions. 
+    Run 'morningstar.py portfolio ticker' to see the result format.
+    """
+    # Ticker check    
+    tt = ticker_type(ticker)
+    if tt != "Mutual Fund" and tt != "ETF":
+        return None    
+
+    # The Morningstar URL
+    url = _url_fund_summary + ticker
+
+    # Get the tables (the page is parsed once)
+    snapshot = dict()
+    snapshot["aal"] = _fund_asset_allocation_table(grindweb.get_web_page_table(url, table_idx=1, normalize=True))
+    snapshot["mkc"] = _fund_market_capitalization_table(grindweb.get_web_page_table(url, table_idx=2))
+    snapshot["sect"] = _fund_sector_weightings_table(grindweb.get_web_page_table(url, table_idx=5))
+    snapshot["reg"] = _fund_market_regions_table(grindweb.get_web_page_table(url, table_idx=6, normalize=True))
+
+    if numeric:
+        for key in snapshot:
+            snapshot[key] = _as_numeric(snapshot[key], numeric)
+
+    return snapshot
+
 def stock_profile(ticker):
     """
     Description:
@@ -1353,42 +1696,30 @@ def stock_profile(ticker):
         return None    
 
     # The Morningstar URL
-    url = "http://quotes.morningstar.com/stockq/c-company-profile?&t="
+    url = _url_stock_profile
     
     # Get the page
     web_page = grindweb.get_web_page(url + ticker)
 
     # Parse the contents
-    soup = BeautifulSoup(web_page, 'lxml')
+    soup = bs4.BeautifulSoup(web_page, 'lxml')
 
-    df = pd.DataFrame(columns = range(1), 
-                      index = range(6))
-    
-    # Set the index
-    df['new_index'] = None
-    df['new_index'][0] = "Sector"
-    df['new_index'][1] = "Industry"
-    df['new_index'][2] = "Stock Type"
-    df['new_index'][3] = "Employees"
-    df['new_index'][4] = "Fiscal Year Ends"
-    df['new_index'][5] = "Stock Style"
-
-    # Promote the 'new_index' column as the new index
-    df2 = df.set_index('new_index')
-    df = df2
-
-    # Clear the index name
-    df.index.name = ""
+    # Index the profile columns in one pass
+    index = grindweb.soup_index(soup, ("class",))
 
-    # Set the ticker name as column label
-    df.columns = [ticker.upper()]
+    labels = []
+    values = []
+    for label, locator in _stock_profile_fields:
+        tags = index.get(locator[:3], [])
+        if locator[3] >= len(tags):
+            raise ValueError("Element %s not found" % (locator,))
+        labels.append(label)
+        values.append(tags[locator[3]].find("span", {"class": "gr_text7"}).getText().strip())
 
-    df.iloc[0, 0] = soup.find_all("div", {"class": "gr_colm1"})[0].find("span", {"class": "gr_text7"}).getText().strip()
-    df.iloc[1, 0] = soup.find_all("div", {"class": "gr_colm1a"})[0].find("span", {"class": "gr_text7"}).getText().strip()
-    df.iloc[2, 0] = soup.find_all("div", {"class": "gr_colm1a"})[1].find("span", {"class": "gr_text7"}).getText().strip()
-    df.iloc[3, 0] = soup.find_all("div", {"class": "gr_colm1"})[1].find("span", {"class": "gr_text7"}).getText().strip()
-    df.iloc[4, 0] = soup.find_all("div", {"class": "gr_colm1a"})[2].find("span", {"class": "gr_text7"}).getText().strip()
-    df.iloc[5, 0] = soup.find_all("div", {"class": "gr_colm1a"})[3].find("span", {"class": "gr_text7"}).getText().strip()
+    # The ticker name is the column label
+    df = pd.DataFrame({ticker.upper(): values}, 
+                      index = pd.Index(labels, name = ""),
+                      dtype = object)
 
     return df
 
@@ -1410,7 +1741,7 @@ def stock_competitors(ticker):
         return None    
 
     # The Morningstar URL
-    url = "http://quotes.morningstar.com/stockq/c-competitors?&t="
+    url = _url_stock_competitors
     
     # Get the table
     df = grindweb.get_web_page_table(url + ticker)
@@ -1423,11 +1754,192 @@ def stock_competitors(ticker):
 
     return df
 
+# Fields served by fetch, indexed by name (same as the sub-command names), with
+# values set to the tuple (function, list of (URL, security types)). The URLs
+# are the pages the function reads for the listed security types.
+_all_types = ("CEF", "ETF", "Index", "Mutual Fund", "Stock")
+_fund_types = ("ETF", "Mutual Fund")
+
+_fields = {
+    "pfh": (performance_history, [(_url_etf_pfh, ("CEF", "ETF", "Mutual Fund")), 
+                                  (_url_index_pfh, ("Index",)), (_url_stock_pfh, ("Stock",))]),
+    "nav-pfh": (nav_performance_history, [(_url_etf_pfh, _fund_types), 
+                                          (_url_index_pfh, ("Index",)), (_url_stock_pfh, ("Stock",))]),
+    "etf-pfh": (etf_performance_history, [(_url_etf_pfh, ("CEF", "ETF", "Mutual Fund"))]),
+    "fund-pfh": (fund_performance_history, [(_url_fund_pfh, _fund_types)]),
+    "index-pfh": (index_performance_history, [(_url_index_pfh, _all_types)]),
+    "stock-pfh": (stock_performance_history, [(_url_stock_pfh, ("Stock",))]),
+    "pfh2": (fund_performance_history2, [(_url_printreport, ("Mutual Fund",))]),
+    "ttl": (trailing_total_returns, [(_url_etf_ttl, ("CEF", "ETF", "Mutual Fund", "Stock")), 
+                                     (_url_index_ttl, ("Index",))]),
+    "nav-ttl": (nav_trailing_total_returns, [(_url_etf_ttl, ("CEF", "ETF", "Mutual Fund", "Stock")), 
+                                             (_url_index_ttl, ("Index",))]),
+    "etf-ttl": (etf_trailing_total_returns, [(_url_etf_ttl, _all_types)]),
+    "fund-ttl": (fund_trailing_total_returns, [(_url_fund_ttl, ("ETF", "Mutual Fund", "Stock"))]),
+    "index-ttl": (index_trailing_total_returns, [(_url_index_ttl, _all_types)]),
+    "ttl2": (fund_trailing_total_returns2, [(_url_printreport, ("Mutual Fund",))]),
+    "qtr": (historical_quarterly_returns, [(_url_cef_qtr % (5, "q"), _all_types)]),
+    "nav-qtr": (nav_historical_quarterly_returns, [(_url_cef_qtr % (5, "q"), _all_types)]),
+    "cef-qtr": (cef_historical_quarterly_returns, [(_url_cef_qtr % (5, "q"), _all_types)]),
+    "fund-qtr": (fund_historical_quarterly_returns, [(_url_fund_qtr % (5, "q"), _all_types)]),
+    "qtr2": (fund2_historical_quarterly_returns, [(_url_printreport, _fund_types)]),
+    "cef-quote": (cef_quote, [(_url_cef_quote, ("CEF",))]),
+    "etf-quote": (etf_quote, [(_url_etf_quote, ("ETF",))]),
+    "fund-quote": (fund_quote, [(_url_fund_quote, _fund_types)]),
+    "stock-quote": (stock_quote, [(_url_stock_quote, ("ETF", "Stock"))]),
+    "aal": (fund_asset_allocation, [(_url_fund_summary, _fund_types)]),
+    "mkc": (fund_market_capitalization, [(_url_fund_summary, _fund_types)]),
+    "sect": (fund_sector_weightings, [(_url_fund_summary, _fund_types)]),
+    "reg": (fund_market_regions, [(_url_fund_summary, _fund_types)]),
+    "stock-profile": (stock_profile, [(_url_stock_profile, ("Stock",))]),
+    "stock-competitors": (stock_competitors, [(_url_stock_competitors, ("Stock",))]),
+}
+
+def _prefetch(tickers, fields, max_workers, errors="raise"):
+    """
+    Description:
+    Resolve the ticker types in one batch, and fetch the pages needed across
+    all tickers and fields concurrently, into the cache.
+
+    Parameters:
+    tickers - The list of tickers.
+    fields - The list of fields (see fetch).
+    max_workers - The number of concurrent fetches.
+    errors - "raise" to raise the first ticker type lookup error, "ignore" 
+             to skip the tickers whose type cannot be found.
+
+    Returns:
+    The list of tickers whose type was found.
+    """
+    for field in fields:
+        if field not in _fields:
+            raise ValueError("Unknown field {}".format(field))
+
+    types, lookup_errors = _ticker_types(tickers, max_workers)
+    if lookup_errors and errors == "raise":
+        raise lookup_errors[next(t for t in tickers if t in lookup_errors)]
+    tickers = [ticker for ticker in tickers if ticker not in lookup_errors]
+
+    urls = []
+    for ticker in tickers:
+        for field in fields:
+            for url, url_types in _fields[field][1]:
+                if types[ticker] in url_types:
+                    urls.append(url + ticker)
+    grindweb.get_web_pages(urls, max_workers=max_workers)
+
+    return tickers
+
+def fetch(tickers, fields=("ttl", "pfh"), max_workers=grindweb.MaxWorkersDefault, errors="raise"):
+    """
+    Description:
+    Get several fields for several tickers. The ticker types are resolved in
+    one batch, the pages needed across all tickers and fields are fetched 
+    once, concurrently, and each page is parsed once.
+
+    Parameters:
+    tickers - The list of tickers.
+    fields - The list of fields, named after the sub-commands ("ttl", "pfh", 
+             "aal", "sect", ...). Quarterly returns use the default 5 years, 
+             quarterly frequency.
+    max_workers - The number of concurrent fetches.
+    errors - "raise" to raise the first ticker type lookup or parse error,
+             "ignore" to skip the tickers whose type cannot be found, and the
+             failed ticker and field pairs.
+
+    Returns:
+    Tidy DataFrame with one row per value, indexed by ticker and field, with
+    columns "row", "column" and "value" holding the row label, column label
+    and value of the field table.
+    """
+    tickers = _prefetch(tickers, fields, max_workers, errors)
+
+    # Parse, from the cache
+    records = []
+    for ticker in tickers:
+        for field in fields:
+            try:
+                df = _fields[field][0](ticker)
+            except Exception:
+                if errors == "raise":
+                    raise
+                continue
+
+            if df is None:
+                continue
+
+            for row, values in zip(df.index, df.values):
+                for column, value in zip(df.columns, values):
+                    records.append((ticker, field, row, column, value))
+
+    df = pd.DataFrame(records, columns=["ticker", "field", "row", "column", "value"])
+
+    return df.set_index(["ticker", "field"])
+
+def snapshot(tickers, fields=("ttl", "pfh"), as_of=None, max_workers=grindweb.MaxWorkersDefault, errors="raise"):
+    """
+    Description:
+    Get several fields for several tickers (see fetch), and store them in the
+    snapshot store (see grindstore.py). Tables that did not change since the 
+    latest stored snapshot are not written again.
+
+    Parameters:
+    tickers - The list of tickers.
+    fields - The list of fields, named after the sub-commands.
+    as_of - The as-of date, "YYYY-MM-DD". Default: today.
+    max_workers - The number of concurrent fetches.
+    errors - "raise" to raise the first ticker type lookup or parse error,
+             "ignore" to skip the tickers whose type cannot be found, and the
+             failed ticker and field pairs.
+
+    Returns:
+    Dictionary indexed by (ticker, field), with values set to True if the
+    table was written, False if it was unchanged.
+    """
+    tickers = _prefetch(tickers, fields, max_workers, errors)
+
+    written = dict()
+    for ticker in tickers:
+        for field in fields:
+            try:
+                df = _fields[field][0](ticker)
+            except Exception:
+                if errors == "raise":
+                    raise
+                continue
+
+            if df is None:
+                continue
+
+            written[(ticker, field)] = grindstore.put_table(ticker, field, df, as_of)
+
+    return written
+
+def stored(ticker, field, as_of=None):
+    """
+    Description:
+    Get a field as stored by snapshot, as of a date. Does not access the web.
+
+    Parameters:
+    ticker - The ticker.
+    field - The field, named after the sub-commands.
+    as_of - The as-of date, "YYYY-MM-DD". Default: the latest snapshot.
+
+    Returns:
+    DataFrame with the latest snapshot taken on or before the date, or None.
+    """
+    return grindstore.get_table(ticker, field, as_of)
+
 def _parse_ticker_type_f(args):
-    type = ticker_type(args.ticker)
+    if len(args.ticker) == 1:
+        type = ticker_type(args.ticker[0])
 
-    if type != "":
-        print(type)
+        if type != "":
+            print(type)
+        return
+
+    for ticker, type in ticker_types(args.ticker).items():
+        print("{} {}".format(ticker, type))
 
 def _parse_ticker_name_f(args):
     type = ticker_name(args.ticker)
@@ -1448,116 +1960,336 @@ def _parse_stock_name_f(args):
         print(type)
 
 def _parse_pfh_f(args):
-    df = performance_history(args.ticker)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    df = performance_history(args.ticker, args.numeric)
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
 
 def _parse_nav_pfh_f(args):
     df = nav_performance_history(args.ticker)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
 
 def _parse_etf_pfh_f(args):
     df = etf_performance_history(args.ticker)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
 
 def _parse_index_pfh_f(args):
     df = index_performance_history(args.ticker)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
 
 def _parse_fund_pfh_f(args):
     df = fund_performance_history(args.ticker)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
 
 def _parse_stock_pfh_f(args):
     df = stock_performance_history(args.ticker)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
 
 def _parse_pfh2_f(args):
     df = fund_performance_history2(args.ticker)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
 
 def _parse_ttl_f(args):
-    df = trailing_total_returns(args.ticker)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    df = trailing_total_returns(args.ticker, args.numeric)
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
 
 def _parse_nav_ttl_f(args):
     df = nav_trailing_total_returns(args.ticker)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
 
 def _parse_etf_ttl_f(args):
     df = etf_trailing_total_returns(args.ticker)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
 
 def _parse_fund_ttl_f(args):
     df = fund_trailing_total_returns(args.ticker)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
 
 def _parse_ttl2_f(args):
     df = fund_trailing_total_returns2(args.ticker)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
 
 def _parse_index_ttl_f(args):
     df = index_trailing_total_returns(args.ticker)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
 
 def _parse_qtr_f(args):
-    df = historical_quarterly_returns(args.ticker, args.years, args.frequency)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    df = historical_quarterly_returns(args.ticker, args.years, args.frequency, args.numeric)
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
 
 def _parse_nav_qtr_f(args):
     df = nav_historical_quarterly_returns(args.ticker, args.years, args.frequency)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
 
 def _parse_cef_qtr_f(args):
     df = cef_historical_quarterly_returns(args.ticker, args.years, args.frequency)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
 
 def _parse_fund_qtr_f(args):
     df = fund_historical_quarterly_returns(args.ticker, args.years, args.frequency)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
 
 def _parse_qtr2_f(args):
     df = fund2_historical_quarterly_returns(args.ticker)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
 
 def _parse_cef_quote(args):
     df = cef_quote(args.ticker)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
 
 def _parse_etf_quote(args):
     df = etf_quote(args.ticker)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
 
 def _parse_fund_quote(args):
     df = fund_quote(args.ticker)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
 
 def _parse_stock_quote(args):
     df = stock_quote(args.ticker)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
 
 def _parse_aal(args):
-    df = fund_asset_allocation(args.ticker)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    df = fund_asset_allocation(args.ticker, args.numeric)
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
 
 def _parse_mkc(args):
-    df = fund_market_capitalization(args.ticker)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    df = fund_market_capitalization(args.ticker, args.numeric)
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
 
 def _parse_sect(args):
-    df = fund_sector_weightings(args.ticker)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    df = fund_sector_weightings(args.ticker, args.numeric)
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
 
 def _parse_reg(args):
-    df = fund_market_regions(args.ticker)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    df = fund_market_regions(args.ticker, args.numeric)
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
+
+def _parse_portfolio(args):
+    snapshot = fund_portfolio_snapshot(args.ticker, args.numeric)
+    if snapshot is None:
+        return
+    for key in ["aal", "mkc", "sect", "reg"]:
+        print(tabulate.tabulate(snapshot[key], headers='keys', tablefmt='psql'))
 
 def _parse_stock_profile(args):
     df = stock_profile(args.ticker)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
 
 def _parse_stock_competitors(args):
     df = stock_competitors(args.ticker)
-    print(tabulate(df, headers='keys', tablefmt='psql'))
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
+
+def _parse_fetch(args):
+    df = fetch(args.ticker, args.fields, errors="ignore")
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
+
+def _parse_snapshot(args):
+    written = snapshot(args.ticker, args.fields, args.as_of, errors="ignore")
+    for (ticker, field), w in sorted(written.items()):
+        print("%s %s %s" % (ticker, field, "written" if w else "unchanged"))
+
+def _parse_stored(args):
+    if args.list:
+        for date in grindstore.table_dates(args.ticker, args.field):
+            print(date)
+        return
+    df = stored(args.ticker, args.field, args.as_of)
+    if df is None:
+        return
+    print(tabulate.tabulate(df, headers='keys', tablefmt='psql'))
+
+ServeHostDefault = "127.0.0.1"
+ServePortDefault = 8765
+ServeFormats = ("json", "csv")
+
+class _ServeError(Exception):
+    """
+    Description:
+    A serve request rejected before running its sub-command.
+
+    Parameters:
+    status - The HTTP status code (404 unknown sub-command, 400 bad option).
+    message - The error message.
+    """
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+# Sub-commands returning names, served by serve
+_serve_names = {
+    "ticker-name": ticker_name,
+    "fund-name": fund_name,
+    "stock-name": stock_name,
+}
+
+def _serve_query(command, params):
+    """
+    Description:
+    Run a sub-command on behalf of the serve mode.
+
+    Parameters:
+    command - The sub-command name.
+    params - The query parameters, as a dictionary with values set to lists.
+             "ticker" may be repeated or comma separated, the other parameters
+             are named after the sub-command options ("years", "frequency",
+             "numeric", "fields", "field", "as_of").
+
+    Returns:
+    The result: a DataFrame, a dictionary of strings or DataFrames, or None.
+    The sub-command and parameters are checked before running it: unknown
+    sub-commands and bad parameters raise _ServeError. Any other exception
+    comes from the sub-command itself.
+    """
+    def param(name, default=None):
+        return params[name][-1] if name in params else default
+
+    def flag(name):
+        return param(name, "0").lower() in ("1", "true", "yes")
+
+    def names(name, default):
+        return [n for v in params.get(name, [default]) for n in v.split(",") if n]
+
+    tickers = names("ticker", "")
+    if command not in _fields and command not in _serve_names and command not in ("ticker-type", "portfolio", "fetch", "stored"):
+        raise _ServeError(404, "Unknown sub-command {}".format(command))
+    if not tickers:
+        raise _ServeError(400, "Missing ticker")
+
+    if command == "ticker-type":
+        return ticker_types(tickers)
+
+    if command in _serve_names:
+        return dict((ticker, _serve_names[command](ticker)) for ticker in tickers)
+
+    if command == "portfolio":
+        return fund_portfolio_snapshot(tickers[0], flag("numeric"))
+
+    if command == "fetch":
+        fields = names("fields", "ttl,pfh")
+        unknown = [field for field in fields if field not in _fields]
+        if unknown:
+            raise _ServeError(400, "Unknown fields {}".format(",".join(unknown)))
+        return fetch(tickers, fields, errors="ignore")
+
+    if command == "stored":
+        if param("field") not in _fields:
+            raise _ServeError(400, "Missing or unknown field")
+        return stored(tickers[0], param("field"), param("as_of"))
+
+    # Tables, with the sub-command options
+    func = _fields[command][0]
+    kwargs = dict()
+    if "years" in params:
+        try:
+            kwargs["years"] = int(param("years"))
+        except ValueError:
+            raise _ServeError(400, "Bad years {}".format(param("years")))
+    if "frequency" in params:
+        kwargs["frequency"] = param("frequency")
+    if "numeric" in params:
+        kwargs["numeric"] = flag("numeric")
+
+    options = inspect.signature(func).parameters
+    unsupported = [name for name in kwargs if name not in options]
+    if unsupported:
+        raise _ServeError(400, "Unsupported option for {}: {}".format(command, ",".join(unsupported)))
+
+    return func(tickers[0], **kwargs)
+
+def _serve_table_json(df):
+    # Labels may be periods or dates, which JSON has no notion of
+    return json.loads(df.rename(index=str, columns=str).to_json(orient="split"))
+
+def _serve_format(result, fmt):
+    """
+    Description:
+    Format a serve result.
+
+    Parameters:
+    result - The result returned by _serve_query.
+    fmt - "json" or "csv".
+
+    Returns:
+    The tuple (content type, body).
+    """
+    if fmt == "csv":
+        if isinstance(result, pd.DataFrame):
+            return "text/csv", result.to_csv()
+        lines = []
+        for key, value in result.items():
+            if isinstance(value, pd.DataFrame):
+                lines.append("# {}\n{}".format(key, value.to_csv()))
+            else:
+                lines.append("{},{}\n".format(key, value))
+        return "text/csv", "".join(lines)
+
+    if isinstance(result, pd.DataFrame):
+        body = _serve_table_json(result)
+    else:
+        body = dict((key, _serve_table_json(value) if isinstance(value, pd.DataFrame) else value) 
+                    for key, value in result.items())
+    return "application/json", json.dumps(body)
+
+def serve(host=ServeHostDefault, port=ServePortDefault):
+    """
+    Description:
+    Serve the sub-commands over HTTP, keeping the web page, ticker type and
+    parsed table caches hot across requests. The sub-command is the URL path,
+    the ticker and options are query parameters, e.g.
+    http://127.0.0.1:8765/pfh?ticker=SPY&numeric=1&format=csv
+    The output format is "json" (default) or "csv". See morningstar-client.py.
+
+    Parameters:
+    host - The address to listen on. Default: 127.0.0.1 (local clients only).
+    port - The port to listen on. Default: 8765.
+    """
+    # Load the modules up front, rather than from concurrent request threads
+    pd.DataFrame
+    bs4.BeautifulSoup
+    grindweb.unidecode.unidecode
+    grindweb.get_session()
+
+    class Handler(http_server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            command = url.path.strip("/")
+            params = parse_qs(url.query)
+            fmt = params.get("format", [ServeFormats[0]])[-1]
+
+            try:
+                if fmt not in ServeFormats:
+                    raise _ServeError(400, "Unknown format {}, expected one of {}".format(fmt, ", ".join(ServeFormats)))
+                result = _serve_query(command, params)
+                if result is None:
+                    self.send_error(404, "No data for {}".format(command))
+                    return
+                content_type, body = _serve_format(result, fmt)
+            except _ServeError as e:
+                self.send_error(e.status, str(e))
+                return
+            except Exception as e:
+                self.send_error(500, "{}: {}".format(type(e).__name__, e))
+                return
+
+            body = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type + "; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = http_server.ThreadingHTTPServer((host, port), Handler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def _parse_serve(args):
+    serve(args.host, args.port)
+
+# Preload the persistent ticker type registry
+_load_ticker_registry()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Download Morningstar data.')
@@ -1566,7 +2298,7 @@ if __name__ == "__main__":
     subparsers = parser.add_subparsers(help='Sub-command help')
 
     parser_ticker_type = subparsers.add_parser('ticker-type', help='Get ticker type (cef, etf, index, fund, stock, cash)')
-    parser_ticker_type.add_argument('ticker', help='Ticker')
+    parser_ticker_type.add_argument('ticker', nargs='+', help='Ticker')
     parser_ticker_type.set_defaults(func=_parse_ticker_type_f)
 
     parser_ticker_name = subparsers.add_parser('ticker-name', help='Get name (all)')
@@ -1583,6 +2315,7 @@ if __name__ == "__main__":
 
     parser_pfh = subparsers.add_parser('pfh', help='Performace history (all)')
     parser_pfh.add_argument('ticker', help='Ticker')
+    parser_pfh.add_argument('-n', '--numeric', action='store_true', help='Convert the values to numbers')
     parser_pfh.set_defaults(func=_parse_pfh_f)
 
     parser_nav_pfh = subparsers.add_parser('nav-pfh', help='NAV performace history (etfs, funds, stocks)')
@@ -1611,6 +2344,7 @@ if __name__ == "__main__":
 
     parser_ttl = subparsers.add_parser('ttl', help='Trailing total returns (all)')
     parser_ttl.add_argument('ticker', help='Ticker')
+    parser_ttl.add_argument('-n', '--numeric', action='store_true', help='Convert the values to numbers')
     parser_ttl.set_defaults(func=_parse_ttl_f)
 
     parser_etf_ttl = subparsers.add_parser('etf-ttl', help='Trailing total returns (all)')
@@ -1637,6 +2371,7 @@ if __name__ == "__main__":
     parser_qtr.add_argument('ticker', help='Ticker')
     parser_qtr.add_argument('-y', '--years', type=int, default=5, help='Number of years (default 5)')
     parser_qtr.add_argument('-f', '--frequency', default='q', help='Frequency (m=monthly, q=quarterly, default=q)')
+    parser_qtr.add_argument('-n', '--numeric', action='store_true', help='Convert the values to numbers')
     parser_qtr.set_defaults(func=_parse_qtr_f)
 
     parser_nav_qtr = subparsers.add_parser('nav-qtr', help='NAV historical quarterly returns (all)')
@@ -1679,20 +2414,29 @@ if __name__ == "__main__":
 
     parser_aal = subparsers.add_parser('aal', help='Asset allocation (etfs, funds)')
     parser_aal.add_argument('ticker', help='Ticker')
+    parser_aal.add_argument('-n', '--numeric', action='store_true', help='Convert the values to numbers')
     parser_aal.set_defaults(func=_parse_aal)
 
     parser_mkc = subparsers.add_parser('mkc', help='Market capitalization (etfs, funds)')
     parser_mkc.add_argument('ticker', help='Ticker')
+    parser_mkc.add_argument('-n', '--numeric', action='store_true', help='Convert the values to numbers')
     parser_mkc.set_defaults(func=_parse_mkc)
 
     parser_sect = subparsers.add_parser('sect', help='Sector weightings (etfs, funds)')
     parser_sect.add_argument('ticker', help='Ticker')
+    parser_sect.add_argument('-n', '--numeric', action='store_true', help='Convert the values to numbers')
     parser_sect.set_defaults(func=_parse_sect)
 
     parser_reg = subparsers.add_parser('reg', help='World regions (etfs, funds)')
     parser_reg.add_argument('ticker', help='Ticker')
+    parser_reg.add_argument('-n', '--numeric', action='store_true', help='Convert the values to numbers')
     parser_reg.set_defaults(func=_parse_reg)
 
+    parser_portfolio = subparsers.add_parser('portfolio', help='Asset allocation, market capitalization, sector weightings, world regions (etfs, funds)')
+    parser_portfolio.add_argument('ticker', help='Ticker')
+    parser_portfolio.add_argument('-n', '--numeric', action='store_true', help='Convert the values to numbers')
+    parser_portfolio.set_defaults(func=_parse_portfolio)
+
     parser_stock_profile = subparsers.add_parser('stock-profile', help='Stock profile')
     parser_stock_profile.add_argument('ticker', help='Ticker')
     parser_stock_profile.set_defaults(func=_parse_stock_profile)
@@ -1701,5 +2445,28 @@ if __name__ == "__main__":
     parser_stock_competitors.add_argument('ticker', help='Ticker')
     parser_stock_competitors.set_defaults(func=_parse_stock_competitors)
 
+    parser_fetch = subparsers.add_parser('fetch', help='Several fields for several tickers (all)')
+    parser_fetch.add_argument('ticker', nargs='+', help='Ticker')
+    parser_fetch.add_argument('-f', '--fields', nargs='+', default=['ttl', 'pfh'], choices=sorted(_fields.keys()), metavar='FIELD', help='Fields, named after the sub-commands (default ttl pfh)')
+    parser_fetch.set_defaults(func=_parse_fetch)
+
+    parser_snapshot = subparsers.add_parser('snapshot', help='Store several fields for several tickers in the snapshot store (all)')
+    parser_snapshot.add_argument('ticker', nargs='+', help='Ticker')
+    parser_snapshot.add_argument('-f', '--fields', nargs='+', default=['ttl', 'pfh'], choices=sorted(_fields.keys()), metavar='FIELD', help='Fields, named after the sub-commands (default ttl pfh)')
+    parser_snapshot.add_argument('-d', '--as-of', help='As-of date, YYYY-MM-DD (default today)')
+    parser_snapshot.set_defaults(func=_parse_snapshot)
+
+    parser_stored = subparsers.add_parser('stored', help='Field from the snapshot store, as of a date (all)')
+    parser_stored.add_argument('ticker', help='Ticker')
+    parser_stored.add_argument('field', choices=sorted(_fields.keys()), metavar='FIELD', help='Field, named after the sub-commands')
+    parser_stored.add_argument('-d', '--as-of', help='As-of date, YYYY-MM-DD (default latest)')
+    parser_stored.add_argument('-l', '--list', action='store_true', help='List the stored dates')
+    parser_stored.set_defaults(func=_parse_stored)
+
+    parser_serve = subparsers.add_parser('serve', help='Serve the sub-commands over HTTP, see morningstar-client.py')
+    parser_serve.add_argument('--host', default=ServeHostDefault, help='Address to listen on (default {})'.format(ServeHostDefault))
+    parser_serve.add_argument('-p', '--port', type=int, default=ServePortDefault, help='Port to listen on (default {})'.format(ServePortDefault))
+    parser_serve.set_defaults(func=_parse_serve)
+
     args = parser.parse_args()
     args.func(args)
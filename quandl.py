@@ -4,11 +4,14 @@ import sys, os
 import pandas as pd
 import argparse
 import datetime
-import requests
+
+# Local modules
+import grindweb
+import grindhist
 
 DirDefault = '/home/andrei/src/market-data/stocks/quandl'
 
-def download_hist_quandl(ticker, ISIN=None, dirname=DirDefault, force=False, debug=False):
+def download_hist_quandl(ticker, ISIN=None, dirname=DirDefault, force=False, debug=False, incremental=False):
     # Today's date
     date = datetime.date.today()
     date_str = date.strftime("%Y%m%d")
@@ -33,20 +36,36 @@ def download_hist_quandl(ticker, ISIN=None, dirname=DirDefault, force=False, deb
         return False
     
     url = 'https://www.quandl.com/api/v3/datasets/WIKI/{}.csv?api_key={}'.format(ticker, api_key)
+
+    # Download the bars since the latest saved history, and merge them
+    old_df = grindhist.load_latest_history(dirname, ticker, before=date_str) if incremental else None
+    start = grindhist.history_start(old_df) if old_df is not None else None
+    if start is not None:
+        new_url = '{}&start_date={}'.format(url, start.strftime("%Y-%m-%d"))
+        new_fname = '{}.part'.format(fname)
+        if debug:
+            print('Get {} from {}'.format(ticker, new_url))
+        try:
+            status = grindweb.download_file(new_url, new_fname, timeout=10)
+            if status == 200 and grindhist.update_history(fname, old_df, new_fname):
+                if debug:
+                    print('Updated {}'.format(fname))
+                return True
+        finally:
+            if os.path.exists(new_fname):
+                os.unlink(new_fname)
+        if debug:
+            print('{}: cannot update the history, downloading all of it'.format(ticker))
+
     if debug:
         print('Get {} from {}'.format(ticker, url))
 
-    r = requests.get(url, timeout=10)
+    status = grindweb.download_file(url, fname, timeout=10)
 
-    if r.status_code != 200:
+    if status != 200:
         if debug:
-            print('HTTP status code {}'.format(r.status_code))
+            print('HTTP status code {}'.format(status))
         return False
-
-    content = r.content
-    
-    with open(fname, "wb") as f:
-        f.write(content)
         
     if debug:
         print('Saved {}'.format(fname))
@@ -59,6 +78,7 @@ if __name__ == "__main__":
     parser.add_argument('--dir', default=DirDefault, help='Output directory. Default: {}.'.format(DirDefault))
     parser.add_argument('-d', '--debug', action='store_true', help='Enable debug messages.')
     parser.add_argument('-f', '--force', action='store_true', help='Force a download even if the data is cached.')
+    parser.add_argument('-i', '--incremental', action='store_true', help='Download only the bars since the latest saved history.')
 
     args = parser.parse_args()
 
@@ -66,4 +86,5 @@ if __name__ == "__main__":
         download_hist_quandl(ticker,
                              dirname=args.dir,
                              force=args.force,
-                             debug=args.debug)    
+                             debug=args.debug,
+                             incremental=args.incremental)    
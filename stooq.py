@@ -4,11 +4,14 @@ import sys, os
 import pandas as pd
 import argparse
 import datetime
-import requests
+
+# Local modules
+import grindweb
+import grindhist
 
 DirDefault = '/home/andrei/src/market-data/stocks/stooq'
 
-def download_hist_stooq(ticker, ISIN=None, dirname=DirDefault, force=False, debug=False):
+def download_hist_stooq(ticker, ISIN=None, dirname=DirDefault, force=False, debug=False, incremental=False):
     # Today's date
     date = datetime.date.today()
     date_str = date.strftime("%Y%m%d")
@@ -28,25 +31,45 @@ def download_hist_stooq(ticker, ISIN=None, dirname=DirDefault, force=False, debu
         os.unlink(fname)
 
     url = 'https://stooq.com/q/d/l/?s={}.us&i=d'.format(ticker)
-    if debug:
-        print('Get {} from {}'.format(ticker, url))
 
-    r = requests.get(url, timeout=10)
+    def check(content):
+        if b'No data' in content:
+            if debug:
+                print('{}: No data.'.format(ticker))
+            return None
+        return content
 
-    if r.status_code != 200:
+    # Download the bars since the latest saved history, and merge them
+    old_df = grindhist.load_latest_history(dirname, ticker, before=date_str) if incremental else None
+    start = grindhist.history_start(old_df) if old_df is not None else None
+    if start is not None:
+        new_url = '{}&d1={}&d2={}'.format(url, start.strftime("%Y%m%d"), date_str)
+        new_fname = '{}.part'.format(fname)
         if debug:
-            print('HTTP status code {}'.format(r.status_code))
-        return False
+            print('Get {} from {}'.format(ticker, new_url))
+        try:
+            status = grindweb.download_file(new_url, new_fname, check=check, timeout=10)
+            if status == 200 and grindhist.update_history(fname, old_df, new_fname):
+                if debug:
+                    print('Updated {}'.format(fname))
+                return True
+        finally:
+            if os.path.exists(new_fname):
+                os.unlink(new_fname)
+        if debug:
+            print('{}: cannot update the history, downloading all of it'.format(ticker))
 
-    content = r.content
+    if debug:
+        print('Get {} from {}'.format(ticker, url))
+
+    status = grindweb.download_file(url, fname, check=check, timeout=10)
+    if status is None:
+        return False
 
-    if 'No data' in content:
+    if status != 200:
         if debug:
-            print('{}: No data.'.format(ticker))
+            print('HTTP status code {}'.format(status))
         return False
-    
-    with open(fname, "wb") as f:
-        f.write(content)
         
     if debug:
         print('Saved {}'.format(fname))
@@ -59,6 +82,7 @@ if __name__ == "__main__":
     parser.add_argument('--dir', default=DirDefault, help='Output directory. Default: {}.'.format(DirDefault))
     parser.add_argument('-d', '--debug', action='store_true', help='Enable debug messages.')
     parser.add_argument('-f', '--force', action='store_true', help='Force a download even if the data is cached.')
+    parser.add_argument('-i', '--incremental', action='store_true', help='Download only the bars since the latest saved history.')
 
     args = parser.parse_args()
 
@@ -66,4 +90,5 @@ if __name__ == "__main__":
         download_hist_stooq(ticker,
                             dirname=args.dir,
                             force=args.force,
-                            debug=args.debug)    
+                            debug=args.debug,
+                            incremental=args.incremental)    
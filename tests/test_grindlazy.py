@@ -0,0 +1,63 @@
+"""
+Tests for grindlazy.py. Each test runs in a fresh interpreter, where the
+lazily imported modules are not loaded yet.
+"""
+import os
+import sys
+import subprocess
+import unittest
+
+RepoDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# First access to a lazily imported module from 8 threads at once, prints
+# the errors
+_probe_module = '''
+import sys, threading
+import grindlazy
+module = grindlazy.lazy_import({module!r})
+barrier = threading.Barrier(8)
+errors = []
+def access():
+    barrier.wait()
+    try:
+        getattr(module, {attr!r})
+    except Exception as e:
+        errors.append(repr(e))
+threads = [threading.Thread(target=access) for _ in range(8)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+print(errors)
+'''
+
+# First batch fetch in replay mode, prints the types of the errors
+_probe_replay = '''
+import os, tempfile
+os.environ['GRIND_CACHE_DIR'] = ''
+import grindweb
+grindweb.set_fixtures(tempfile.mkdtemp(), 'replay')
+urls = ['http://example.com/{}'.format(i) for i in range(8)]
+print(sorted(set(type(r.error).__name__ for r in grindweb.get_web_pages(urls))))
+'''
+
+def run(code):
+    out = subprocess.check_output([sys.executable, '-c', code], cwd=RepoDir)
+    return out.decode('utf-8').strip().splitlines()[-1]
+
+class LazyImportTest(unittest.TestCase):
+    def test_threaded_first_access(self):
+        for module, attr in [('pandas', 'DataFrame'), ('requests', 'Session'), ('bs4', 'BeautifulSoup')]:
+            self.assertEqual(run(_probe_module.format(module=module, attr=attr)), '[]', module)
+
+    def test_threaded_replay(self):
+        # Missing fixtures are reported as connection errors, the lazily
+        # imported requests module must be usable from all the threads
+        self.assertEqual(run(_probe_replay), "['ConnectionError']")
+
+    def test_not_loaded_until_used(self):
+        code = 'import grindlazy; m = grindlazy.lazy_import("tabulate"); print(grindlazy.is_loaded("tabulate"))'
+        self.assertEqual(run(code), 'False')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+"""
+Tests for grindweb.py, without network access.
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Local modules
+import grindweb
+
+pd = grindweb.pd
+
+class LabelsToPeriodsTest(unittest.TestCase):
+    def convert(self, labels):
+        return grindweb.labels_to_periods(pd.Index(labels, name='label'))
+
+    def test_periods(self):
+        self.assertEqual(list(self.convert(['2018', '2019'])), 
+                         [pd.Period(year=2018, freq='Y'), pd.Period(year=2019, freq='Y')])
+        self.assertEqual(list(self.convert(['2018 Q1', '2018-Q4'])), 
+                         [pd.Period(year=2018, quarter=1, freq='Q'), pd.Period(year=2018, quarter=4, freq='Q')])
+        self.assertEqual(list(self.convert(['12/2018', '1/2019'])), 
+                         [pd.Period(year=2018, month=12, freq='M'), pd.Period(year=2019, month=1, freq='M')])
+
+    def test_dates(self):
+        index = self.convert(['12/31/2018', '1/2/2019'])
+        self.assertIsInstance(index, pd.DatetimeIndex)
+        self.assertEqual(list(index), [pd.Timestamp(2018, 12, 31), pd.Timestamp(2019, 1, 2)])
+        self.assertEqual(index.name, 'label')
+
+    def test_unchanged(self):
+        # Out of range, impossible dates, and mixed formats
+        for labels in [['13/2018'], ['2018-13'], ['2/30/2018'], ['12/31/2018', '2018-12-31'],
+                       ['12/2018', '2018-12'], ['2018', 'Total']]:
+            index = self.convert(labels)
+            self.assertEqual(list(index), labels)
+            self.assertNotIsInstance(index, (pd.PeriodIndex, pd.DatetimeIndex))
+
+if __name__ == '__main__':
+    unittest.main()
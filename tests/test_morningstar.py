@@ -0,0 +1,56 @@
+"""
+Tests for morningstar.py, without network access.
+"""
+import os
+import sys
+import unittest
+
+# Keep the tests independent of the on-disk cache and ticker registry
+os.environ['GRIND_CACHE_DIR'] = ''
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Local modules
+import grindweb
+import morningstar
+
+class FetchTest(unittest.TestCase):
+    """
+    fetch with one bad ticker in a batch.
+    """
+    def setUp(self):
+        self.saved = (morningstar._fetch_ticker_type, grindweb.get_web_pages, dict(morningstar._fields))
+        morningstar._ticker_cache.clear()
+
+        def fetch_ticker_type(ticker):
+            if ticker == 'NOPE':
+                raise IOError('No such ticker {}'.format(ticker))
+            return 'Stock'
+
+        def table(ticker):
+            return morningstar.pd.DataFrame([[1.0]], index=['row'], columns=['column'])
+
+        morningstar._fetch_ticker_type = fetch_ticker_type
+        grindweb.get_web_pages = lambda urls, **kwargs: []
+        morningstar._fields['test'] = (table, [('http://example.com/?t=', ('Stock',))])
+
+    def tearDown(self):
+        morningstar._fetch_ticker_type, grindweb.get_web_pages, fields = self.saved
+        morningstar._fields.clear()
+        morningstar._fields.update(fields)
+        morningstar._ticker_cache.clear()
+
+    def test_ticker_types(self):
+        types = morningstar.ticker_types(['XYZ', 'NOPE', 'ABC'])
+        self.assertEqual(types, {'XYZ': 'Stock', 'NOPE': None, 'ABC': 'Stock'})
+
+    def test_fetch_ignore(self):
+        df = morningstar.fetch(['XYZ', 'NOPE', 'ABC'], ['test'], errors='ignore')
+        self.assertEqual(sorted(set(df.index.get_level_values('ticker'))), ['ABC', 'XYZ'])
+
+    def test_fetch_raise(self):
+        with self.assertRaises(IOError):
+            morningstar.fetch(['XYZ', 'NOPE', 'ABC'], ['test'], errors='raise')
+
+if __name__ == '__main__':
+    unittest.main()
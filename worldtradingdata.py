@@ -4,11 +4,14 @@ import sys, os
 import pandas as pd
 import argparse
 import datetime
-import requests
+
+# Local modules
+import grindweb
+import grindhist
 
 DirDefault = '/home/andrei/src/market-data/stocks/world-trading-data'
 
-def download_hist_world_trading_data(ticker, ISIN=None, dirname=DirDefault, force=False, debug=False):
+def download_hist_world_trading_data(ticker, ISIN=None, dirname=DirDefault, force=False, debug=False, incremental=False):
     # Today's date
     date = datetime.date.today()
     date_str = date.strftime("%Y%m%d")
@@ -41,33 +44,54 @@ def download_hist_world_trading_data(ticker, ISIN=None, dirname=DirDefault, forc
     }
     if debug:
         print('Get {} from {}'.format(ticker, url))
+    def check(content):
+        if b'You have reached your request limit for the day' in content:
+            if debug:
+                print('{}: You have reached your request limit for the day.'.format(ticker))
+            return None
+    
+        if b'The requested stock could not be found' in content:
+            if debug:
+                print('{}: The requested stock could not be found.'.format(ticker))
+            # Overwrite the contents
+            return b'Date,Open,Close,High,Low,Volume'
+
+        return content
+
+    # Download the bars since the latest saved history, and merge them
+    old_df = grindhist.load_latest_history(dirname, ticker, before=date_str) if incremental else None
+    start = grindhist.history_start(old_df) if old_df is not None else None
+    if start is not None:
+        new_params = dict(params, date_from=start.strftime("%Y-%m-%d"))
+        new_fname = '{}.part'.format(fname)
+        try:
+            status = grindweb.download_file(url, new_fname, check=check, check_whole=True, params=new_params, timeout=1)
+            if status == 200 and grindhist.update_history(fname, old_df, new_fname):
+                if debug:
+                    print('Updated {}'.format(fname))
+                return True
+        except:
+            pass
+        finally:
+            if os.path.exists(new_fname):
+                os.unlink(new_fname)
+        if debug:
+            print('{}: cannot update the history, downloading all of it'.format(ticker))
+
     try:
-        r = requests.get(url, params=params, timeout=1)
+        status = grindweb.download_file(url, fname, check=check, check_whole=True, params=params, timeout=1)
     except:
         if debug:
             print('Failed to get history for {}'.format(ticker))
         return False
 
-    if r.status_code != 200:
-        if debug:
-            print('HTTP status code {}'.format(r.status_code))
+    if status is None:
         return False
 
-    content = r.content
-    
-    if 'You have reached your request limit for the day' in content:
+    if status != 200:
         if debug:
-            print('{}: You have reached your request limit for the day.'.format(ticker))
+            print('HTTP status code {}'.format(status))
         return False
-    
-    if 'The requested stock could not be found' in content:
-        if debug:
-            print('{}: The requested stock could not be found.'.format(ticker))
-        # Overwrite the contents
-        content = 'Date,Open,Close,High,Low,Volume'
-    
-    with open(fname, "wb") as f:
-        f.write(content)
         
     if debug:
         print('Saved {}'.format(fname))
@@ -80,6 +104,7 @@ if __name__ == "__main__":
     parser.add_argument('--dir', default=DirDefault, help='Output directory. Default: {}.'.format(DirDefault))
     parser.add_argument('-d', '--debug', action='store_true', help='Enable debug messages.')
     parser.add_argument('-f', '--force', action='store_true', help='Force a download even if the data is cached.')
+    parser.add_argument('-i', '--incremental', action='store_true', help='Download only the bars since the latest saved history.')
 
     args = parser.parse_args()
 
@@ -87,4 +112,5 @@ if __name__ == "__main__":
         download_hist_world_trading_data(ticker,
                                          dirname=args.dir,
                                          force=args.force,
-                                         debug=args.debug)    
+                                         debug=args.debug,
+                                         incremental=args.incremental)    
@@ -6,9 +6,13 @@ import pandas as pd
 import argparse
 import datetime
 
+# Local modules
+import grindstats
+import grindhist
+
 DirDefault = '/home/andrei/src/market-data/stocks/yahoo'
 
-def download_hist_yahoo(ticker, ISIN=None, dirname=DirDefault, force=False, debug=False):
+def download_hist_yahoo(ticker, ISIN=None, dirname=DirDefault, force=False, debug=False, incremental=False):
     # Today's date
     date = datetime.date.today()
     date_str = date.strftime("%Y%m%d")
@@ -37,8 +41,24 @@ def download_hist_yahoo(ticker, ISIN=None, dirname=DirDefault, force=False, debu
     except:
         pass
 
+    # Download the bars since the latest saved history, and merge them
+    old_df = grindhist.load_latest_history(dirname, ticker, before=date_str) if incremental else None
+    start = grindhist.history_start(old_df) if old_df is not None else None
+    if start is not None:
+        with grindstats.timed('history', 'finance.yahoo.com'):
+            df = yticker.history(start=start.strftime("%Y-%m-%d"))
+
+        # Compare and merge as saved, i.e. as CSV text
+        if not df.empty and grindhist.update_history(fname, old_df, df.to_csv().encode('utf-8')):
+            if debug:
+                print('Updated {}'.format(fname))
+            return True
+        if debug:
+            print('{}: cannot update the history, downloading all of it'.format(ticker))
+
     # Download the max history
-    df = yticker.history(period="max")
+    with grindstats.timed('history', 'finance.yahoo.com'):
+        df = yticker.history(period="max")
 
     # Check if we downloaded anything
     if df.empty:
@@ -58,6 +78,7 @@ if __name__ == "__main__":
     parser.add_argument('--dir', default=DirDefault, help='Output directory. Default: {}.'.format(DirDefault))
     parser.add_argument('-d', '--debug', action='store_true', help='Enable debug messages.')
     parser.add_argument('-f', '--force', action='store_true', help='Force a download even if the data is cached.')
+    parser.add_argument('-i', '--incremental', action='store_true', help='Download only the bars since the latest saved history.')
 
     args = parser.parse_args()
 
@@ -65,4 +86,5 @@ if __name__ == "__main__":
         download_hist_yahoo(ticker,
                             dirname=args.dir,
                             force=args.force,
-                            debug=args.debug)    
+                            debug=args.debug,
+                            incremental=args.incremental)    